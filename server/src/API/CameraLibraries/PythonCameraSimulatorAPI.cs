@@ -252,11 +252,26 @@ public class PythonCameraSimulatorAPI : ICamera
     {
         string[] scriptFilenames =
         {
+            "cameraProfiles.py",
             "communicator.py",
             "constants.py",
+            "fireRegions.py",
+            "flirRadiometric.py",
+            "framePipeline.py",
+            "frameTriage.py",
+            "instrumentation.py",
             "oldParser.py",
+            "parserBatch.py",
+            "parserBenchmark.py",
+            "parserDaemon.py",
+            "resultCache.py",
+            "resultDelivery.py",
+            "resultOutbox.py",
+            "sequenceAnalyzer.py",
             "show_working_areas.py",
+            "temperatures.py",
             "thermalImageParser.py",
+            "tiledParser.py",
             "utils.py"
         };
 
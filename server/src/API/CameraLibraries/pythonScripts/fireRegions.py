@@ -0,0 +1,84 @@
+from numpy import ndarray, nonzero, diff, zeros, int8, int64, bincount, unique, full, minimum, maximum, cumsum, array
+
+# Etykietowanie spójnych obszarów gorących pikseli: maska dzielona jest na odcinki w wierszach (run-length),
+# a odcinki stykające się z odcinkami z poprzedniego wiersza łączone są przez union-find.
+# Statystyki obszarów liczone są wektorowo dla odcinków, bez przechodzenia po pojedynczych pikselach w Pythonie
+
+def get_runs(mask: ndarray) -> tuple[ndarray, ndarray, ndarray]:
+    # Wiersz, początek i koniec (bez niego) każdego odcinka, w kolejności wierszami
+    padded = zeros((mask.shape[0], mask.shape[1] + 2), dtype = int8)
+    padded[:, 1:-1] = mask
+    changes = diff(padded, axis = 1)
+    rows, starts = nonzero(changes == 1)
+    _, ends = nonzero(changes == -1)
+    return rows, starts, ends
+
+def find_root(parent: list[int], i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+def label_runs(rows: ndarray, starts: ndarray, ends: ndarray, connectivity: int = 8) -> ndarray:
+    # Przy sąsiedztwie 8 odcinki stykające się rogami też należą do jednego obszaru
+    reach = 1 if connectivity == 8 else 0
+    rows, starts, ends = rows.tolist(), starts.tolist(), ends.tolist()
+    parent = list(range(len(rows)))
+    previous_first, previous_last = 0, 0
+    current_first = 0
+    while current_first < len(rows):
+        row = rows[current_first]
+        current_last = current_first
+        while current_last < len(rows) and rows[current_last] == row:
+            current_last += 1
+        # Odcinki poprzedniego wiersza są brane pod uwagę tylko, jeśli to wiersz bezpośrednio wyżej
+        if previous_last > previous_first and rows[previous_first] == row - 1:
+            i, j = current_first, previous_first
+            while i < current_last and j < previous_last:
+                if starts[i] < ends[j] + reach and starts[j] < ends[i] + reach:
+                    root_i, root_j = find_root(parent, i), find_root(parent, j)
+                    if root_i != root_j:
+                        parent[max(root_i, root_j)] = min(root_i, root_j)
+                if ends[i] < ends[j]:
+                    i += 1
+                else:
+                    j += 1
+        previous_first, previous_last = current_first, current_last
+        current_first = current_last
+    return array([find_root(parent, i) for i in range(len(parent))], dtype = int64)
+
+def find_regions(danger_mask: ndarray, image_arr: ndarray, temperature_lut: ndarray, rounding: int = -1, connectivity: int = 8, min_pixels: int = 1) -> list[dict]:
+    rows, starts, ends = get_runs(danger_mask)
+    if len(rows) == 0:
+        return []
+    _, labels = unique(label_runs(rows, starts, ends, connectivity), return_inverse = True)
+    region_count = int(labels.max()) + 1
+    lengths = ends - starts
+    pixels = bincount(labels, weights = lengths, minlength = region_count).astype(int64)
+    sums_x = bincount(labels, weights = lengths * (starts + ends - 1) / 2, minlength = region_count)
+    sums_y = bincount(labels, weights = lengths * rows, minlength = region_count)
+    left = full(region_count, danger_mask.shape[1], dtype = int64)
+    right = full(region_count, -1, dtype = int64)
+    top = full(region_count, danger_mask.shape[0], dtype = int64)
+    bottom = full(region_count, -1, dtype = int64)
+    minimum.at(left, labels, starts)
+    maximum.at(right, labels, ends - 1)
+    minimum.at(top, labels, rows)
+    maximum.at(bottom, labels, rows)
+    # Wartości gorących pikseli są w tej samej kolejności co odcinki, więc maksimum odcinka to reduceat po ich początkach
+    run_maxima = maximum.reduceat(image_arr[danger_mask], cumsum(lengths) - lengths)
+    hottest = zeros(region_count, dtype = run_maxima.dtype)
+    maximum.at(hottest, labels, run_maxima)
+    round_value = (lambda value: value) if rounding < 0 else (lambda value: round(value, rounding))
+    regions = []
+    for i in range(region_count):
+        if pixels[i] < min_pixels:
+            continue
+        regions.append({
+            'pixels': int(pixels[i]),
+            'bounding box': ((int(left[i]), int(top[i])), (int(right[i]), int(bottom[i]))),
+            'centroid': (round_value(float(sums_x[i] / pixels[i])), round_value(float(sums_y[i] / pixels[i]))),
+            'hottest temperature': round_value(float(temperature_lut[hottest[i]]))
+        })
+    regions.sort(key = lambda region: region['pixels'], reverse = True)
+    return regions
\ No newline at end of file
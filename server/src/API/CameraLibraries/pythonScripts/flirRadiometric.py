@@ -0,0 +1,119 @@
+from numpy import ndarray, frombuffer, uint16
+from struct import unpack_from
+from io import BytesIO
+
+# Odczyt surowych danych z czujnika zapisanych przez kamery FLIR w segmentach APP1 pliku JPEG.
+# Segmenty "FLIR\0" zawierają kolejne kawałki pliku FFF, a ten rekordy: surową macierz (RawData) i stałe kalibracji (CameraInfo).
+# Przeglądane są tylko nagłówki segmentów (przez memoryview, bez kopiowania), a obraz JPEG nie jest dekodowany
+_app1_marker = 0xE1
+_start_of_scan_marker = 0xDA
+_end_of_image_marker = 0xD9
+# Markery bez długości i danych
+_standalone_markers = frozenset((0x01, *range(0xD0, 0xD8)))
+_flir_segment_header = b'FLIR\x00'
+_flir_chunk_header_size = 8
+_fff_magic = b'FFF\x00'
+_fff_version_offset = 20
+_fff_index_offset = 24
+_fff_index_entry_size = 32
+_raw_data_record = 0x01
+_camera_info_record = 0x20
+_raw_data_header_size = 32
+_png_signature = b'\x89PNG\r\n\x1a\n'
+# Położenie stałych w rekordzie CameraInfo (jak w ExifTool): nazwa, przesunięcie, format
+_camera_info_fields = (
+    ('emissivity', 0x20, 'f'),
+    ('object distance', 0x24, 'f'),
+    ('reflected temperature', 0x28, 'f'),
+    ('atmospheric temperature', 0x2C, 'f'),
+    ('ir window temperature', 0x30, 'f'),
+    ('ir window transmission', 0x34, 'f'),
+    ('relative humidity', 0x3C, 'f'),
+    ('planck r1', 0x58, 'f'),
+    ('planck b', 0x5C, 'f'),
+    ('planck f', 0x60, 'f'),
+    ('atmospheric alpha 1', 0x70, 'f'),
+    ('atmospheric alpha 2', 0x74, 'f'),
+    ('atmospheric beta 1', 0x78, 'f'),
+    ('atmospheric beta 2', 0x7C, 'f'),
+    ('atmospheric x', 0x80, 'f'),
+    ('planck o', 0x308, 'i'),
+    ('planck r2', 0x30C, 'f')
+)
+
+def get_fff_data(data: bytes) -> bytes | None:
+    # Kawałki pliku FFF z kolejnych segmentów APP1, złożone według numerów kawałków. None, jeśli plik nie zawiera danych FLIR
+    view = memoryview(data)
+    if len(view) < 4 or view[0] != 0xFF or view[1] != 0xD8:
+        return None
+    chunks = {}
+    position = 2
+    while position + 4 <= len(view):
+        if view[position] != 0xFF:
+            return None
+        marker = view[position + 1]
+        if marker == 0xFF:
+            position += 1
+            continue
+        if marker in _standalone_markers:
+            position += 2
+            continue
+        if marker in (_start_of_scan_marker, _end_of_image_marker):
+            break
+        length = (view[position + 2] << 8) | view[position + 3]
+        segment = view[position + 4:position + 2 + length]
+        if marker == _app1_marker and segment[:len(_flir_segment_header)] == _flir_segment_header:
+            chunks[segment[6]] = segment[_flir_chunk_header_size:]
+        position += 2 + length
+    if not chunks:
+        return None
+    return b''.join(chunks[index] for index in sorted(chunks))
+
+def get_fff_records(fff: bytes) -> dict[int, memoryview]:
+    if fff[:len(_fff_magic)] != _fff_magic:
+        raise ValueError('Embedded FLIR data is not an FFF file')
+    # Kolejność bajtów rozpoznawana po numerze wersji (100-199)
+    version = unpack_from('>I', fff, _fff_version_offset)[0]
+    byte_order = '>' if 100 <= version < 200 else '<'
+    index_offset, entries = unpack_from(byte_order + 'II', fff, _fff_index_offset)
+    view = memoryview(fff)
+    records = {}
+    for i in range(entries):
+        record_type, _, _, _, offset, length = unpack_from(byte_order + 'HHIIII', fff, index_offset + i * _fff_index_entry_size)
+        if record_type != 0 and record_type not in records:
+            records[record_type] = view[offset:offset + length]
+    return records
+
+def get_record_byte_order(record: memoryview) -> str:
+    # Pierwsze dwa bajty rekordu to 2 zapisane w jego kolejności bajtów
+    return '<' if unpack_from('<H', record, 0)[0] == 2 else '>'
+
+def get_raw_sensor_array(record: memoryview) -> ndarray:
+    byte_order = get_record_byte_order(record)
+    width, height = unpack_from(byte_order + 'HH', record, 2)
+    data = record[_raw_data_header_size:]
+    if data[:len(_png_signature)] == _png_signature:
+        # Pillow importowany tylko dla danych w PNG. FLIR zapisuje w nich wartości z zamienioną kolejnością bajtów
+        from PIL import Image
+        from numpy import asarray
+        return asarray(Image.open(BytesIO(data)), dtype = uint16).byteswap()
+    return frombuffer(data, dtype = byte_order + 'u2', count = width * height).reshape(height, width).astype(uint16)
+
+def get_calibration(record: memoryview) -> tuple[tuple[str, float], ...]:
+    # Krotka par (nazwa, wartość), żeby mogła być kluczem tablicy temperatur w lru_cache
+    byte_order = get_record_byte_order(record)
+    calibration = {name: unpack_from(byte_order + field_format, record, offset)[0] for name, offset, field_format in _camera_info_fields}
+    # Wilgotność zapisywana jest jako ułamek albo w procentach
+    if calibration['relative humidity'] > 2:
+        calibration['relative humidity'] /= 100
+    return tuple((name, float(value)) for name, value in calibration.items())
+
+def read_radiometric_data(data: bytes) -> tuple[ndarray, tuple[tuple[str, float], ...]] | None:
+    # Surowa macierz z czujnika i kalibracja, albo None, jeśli obraz nie zawiera danych radiometrycznych
+    fff = get_fff_data(data)
+    if fff is None:
+        return None
+    records = get_fff_records(fff)
+    if _raw_data_record not in records or _camera_info_record not in records:
+        return None
+    return get_raw_sensor_array(records[_raw_data_record]), get_calibration(records[_camera_info_record])
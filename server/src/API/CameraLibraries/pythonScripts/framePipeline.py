@@ -0,0 +1,151 @@
+from queue import Queue
+from threading import Thread, Lock
+from time import perf_counter
+
+_default_queue_size = 4
+_metrics_prefix = 'thermal_parser_pipeline'
+# Znacznik końca danych przekazywany przez kolejki
+_end = object()
+
+class PipelineStage:
+    # Jeden etap potoku: workers wątków bierze elementy z kolejki wejściowej (najwyżej queue_size elementów),
+    # wywołuje na nich function i przekazuje wynik do następnego etapu. Pełna kolejka wstrzymuje poprzedni etap
+    def __init__(self, name: str, function, workers: int = 1, queue_size: int = _default_queue_size):
+        self.name = name
+        self.function = function
+        self.workers = workers
+        self.queue = Queue(queue_size)
+        self.queue_size = queue_size
+        self.lock = Lock()
+        self.items = 0
+        self.busy = 0.
+        self.blocked = 0.
+        self.depth_total = 0
+        self.max_depth = 0
+        self.finished_workers = 0
+
+    def record(self, busy: float, blocked: float, depth: int) -> None:
+        with self.lock:
+            self.items += 1
+            self.busy += busy
+            self.blocked += blocked
+            self.depth_total += depth
+            self.max_depth = max(self.max_depth, depth)
+
+    def get_counters(self, elapsed: float) -> dict:
+        # utilization: udział czasu pracy we wspólnym czasie wszystkich wątków etapu. blocked: czas czekania na miejsce
+        # w kolejce następnego etapu - duży oznacza, że to następny etap jest wąskim gardłem
+        with self.lock:
+            return {
+                'items': self.items,
+                'workers': self.workers,
+                'utilization': self.busy / (elapsed * self.workers) if elapsed > 0 else 0.,
+                'mean queue depth': self.depth_total / self.items if self.items > 0 else 0.,
+                'max queue depth': self.max_depth,
+                'queue size': self.queue_size,
+                'blocked seconds': self.blocked
+            }
+
+class FramePipeline:
+    # Etapy połączone ograniczonymi kolejkami, każdy we własnych wątkach, więc czytanie, dekodowanie, analiza i wysyłanie
+    # kolejnych obrazów odbywają się jednocześnie. Elementy numerowane są przy wejściu, a ostatni etap (jeden wątek)
+    # dostaje je w kolejności wejścia, nawet gdy wcześniejsze etapy mają kilka wątków.
+    # Funkcje etapów powinny same zamieniać błędy na wynik - wyjątek zatrzymuje potok i jest zgłaszany przez run()
+    def __init__(self, stages: list[PipelineStage], source_name: str = 'read'):
+        self.stages = stages
+        self.source = PipelineStage(source_name, None, 1, 0)
+        self.threads = []
+        self.error = None
+        self.started = None
+        self.finished = None
+
+    def run(self, source) -> None:
+        # source to iterator elementów wejściowych, czytany w bieżącym wątku
+        self.started = perf_counter()
+        for index, stage in enumerate(self.stages):
+            next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+            workers = 1 if next_stage is None else stage.workers
+            for _ in range(workers):
+                thread = Thread(target = self.work, args = (stage, next_stage), name = 'pipeline-{}'.format(stage.name), daemon = True)
+                thread.start()
+                self.threads.append(thread)
+        number = 0
+        iterator = iter(source)
+        try:
+            while self.error is None:
+                start = perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                read_end = perf_counter()
+                self.stages[0].queue.put((number, item))
+                self.source.record(read_end - start, perf_counter() - read_end, 0)
+                number += 1
+        finally:
+            for _ in range(self.stages[0].workers if len(self.stages) > 1 else 1):
+                self.stages[0].queue.put(_end)
+            for thread in self.threads:
+                thread.join()
+            self.finished = perf_counter()
+        if self.error is not None:
+            raise self.error
+
+    def work(self, stage: PipelineStage, next_stage: PipelineStage | None) -> None:
+        # Ostatni etap przywraca kolejność wejścia, trzymając elementy, które wyprzedziły wcześniejsze
+        waiting = {}
+        expected = 0
+        while True:
+            depth = stage.queue.qsize()
+            entry = stage.queue.get()
+            if entry is _end:
+                break
+            number, item = entry
+            if next_stage is None:
+                waiting[number] = item
+                while expected in waiting:
+                    self.process(stage, None, expected, waiting.pop(expected), depth)
+                    expected += 1
+            else:
+                self.process(stage, next_stage, number, item, depth)
+        if next_stage is not None:
+            with stage.lock:
+                stage.finished_workers += 1
+                last = stage.finished_workers == stage.workers
+            # Ostatni kończący wątek etapu przekazuje koniec danych wszystkim wątkom następnego
+            if last:
+                for _ in range(next_stage.workers if next_stage is not self.stages[-1] else 1):
+                    next_stage.queue.put(_end)
+
+    def process(self, stage: PipelineStage, next_stage: PipelineStage | None, number: int, item, depth: int) -> None:
+        start = perf_counter()
+        if self.error is None:
+            try:
+                item = stage.function(item)
+            except Exception as error:
+                self.error = error
+        end = perf_counter()
+        if next_stage is not None:
+            next_stage.queue.put((number, item))
+        stage.record(end - start, perf_counter() - end, depth)
+
+    def get_counters(self) -> dict:
+        elapsed = (self.finished or perf_counter()) - self.started if self.started is not None else 0.
+        return {stage.name: stage.get_counters(elapsed) for stage in [self.source] + self.stages}
+
+    def get_metric_lines(self) -> list[str]:
+        # Linie w formacie Prometheus, dołączane do pliku metryk (StageMetrics)
+        counters = self.get_counters()
+        lines = []
+        for metric, key, metric_type, description in (
+                ('items_total', 'items', 'counter', 'Number of items processed by each pipeline stage'),
+                ('utilization_ratio', 'utilization', 'gauge', 'Share of time workers of each pipeline stage were busy'),
+                ('queue_depth_mean', 'mean queue depth', 'gauge', 'Mean number of items waiting for each pipeline stage'),
+                ('queue_depth_max', 'max queue depth', 'gauge', 'Largest number of items waiting for each pipeline stage'),
+                ('blocked_seconds_total', 'blocked seconds', 'counter', 'Time each pipeline stage waited for space in the next queue')
+        ):
+            lines.append('# HELP {}_{} {}'.format(_metrics_prefix, metric, description))
+            lines.append('# TYPE {}_{} {}'.format(_metrics_prefix, metric, metric_type))
+            for name, stage in counters.items():
+                lines.append('{}_{}{{stage="{}"}} {}'.format(_metrics_prefix, metric, name, stage[key]))
+        return lines
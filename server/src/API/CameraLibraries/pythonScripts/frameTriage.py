@@ -0,0 +1,27 @@
+from threading import Lock
+
+class TriageCounters:
+    # Liczba obrazów, na które w tym procesie odpowiedział każdy etap triage: 'coarse' (sam najjaśniejszy piksel obszarów
+    # wystarczył, żeby wykazać brak gorących pikseli) i 'full' (pełne liczenie), oraz odsetek przekazanych do pełnego liczenia.
+    # Jeden licznik na proces, więc nie rośnie z liczbą konfiguracji
+    def __init__(self):
+        self.lock = Lock()
+        self.coarse_frames = 0
+        self.full_frames = 0
+
+    def record(self, tier: str, rounding: int) -> dict:
+        with self.lock:
+            if tier == 'coarse':
+                self.coarse_frames += 1
+            else:
+                self.full_frames += 1
+            escalation_rate = self.full_frames / (self.coarse_frames + self.full_frames)
+        return {
+            'tier': tier,
+            'escalation rate': escalation_rate if rounding < 0 else round(escalation_rate, rounding + 2)
+        }
+
+_counters = TriageCounters()
+
+def get_triage_counters() -> TriageCounters:
+    return _counters
@@ -0,0 +1,162 @@
+from contextlib import contextmanager, nullcontext
+from os import replace, getpid
+from os.path import basename
+from threading import Lock
+from time import perf_counter, thread_time, monotonic
+
+_default_profile_entries = 15
+# Granice przedziałów histogramu czasów etapów w sekundach
+_default_buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5)
+_metrics_prefix = 'thermal_parser'
+
+class StageTimer:
+    # Czas rzeczywisty i czas procesora (wątku) każdego etapu analizy. Wyłączony nic nie mierzy
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.stages = {}
+
+    def stage(self, name: str):
+        if not self.enabled:
+            return nullcontext()
+        return self.measure(name)
+
+    @contextmanager
+    def measure(self, name: str):
+        wall_start, cpu_start = perf_counter(), thread_time()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault(name, {'wall ms': 0., 'cpu ms': 0.})
+            entry['wall ms'] += 1000 * (perf_counter() - wall_start)
+            entry['cpu ms'] += 1000 * (thread_time() - cpu_start)
+
+    def get_timings(self) -> dict:
+        return {name: {key: round(value, 3) for key, value in entry.items()} for name, entry in self.stages.items()}
+
+class FrameProfiler:
+    # cProfile i tracemalloc dla jednej analizy, tylko dla wybranych klatek, bo spowalniają ją kilkukrotnie
+    def __init__(self, enabled: bool = True, entries: int = _default_profile_entries):
+        self.enabled = enabled
+        self.entries = entries
+        self.profiler = None
+        self.started_tracing = False
+        self.peak_memory = None
+
+    def __enter__(self):
+        if not self.enabled:
+            return self
+        # Moduły profilujące importowane tylko dla profilowanych klatek
+        import tracemalloc
+        from cProfile import Profile
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        tracemalloc.reset_peak()
+        self.profiler = Profile()
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *exception) -> None:
+        if not self.enabled:
+            return
+        import tracemalloc
+        self.profiler.disable()
+        self.peak_memory = tracemalloc.get_traced_memory()[1]
+        if self.started_tracing:
+            tracemalloc.stop()
+
+    def get_results(self) -> dict:
+        # Funkcje o największym łącznym czasie (razem z wywoływanymi) i największe zużycie pamięci
+        from pstats import Stats
+        functions = []
+        stats = Stats(self.profiler).stats
+        for (filename, line, function), (_, calls, total_time, cumulative_time, _) in sorted(stats.items(), key = lambda item: item[1][3], reverse = True)[:self.entries]:
+            functions.append({
+                'function': '{}:{}({})'.format(basename(filename), line, function),
+                'calls': calls,
+                'total ms': round(1000 * total_time, 3),
+                'cumulative ms': round(1000 * cumulative_time, 3)
+            })
+        return {
+            'profile': functions,
+            'memory peak bytes': self.peak_memory
+        }
+
+class StageMetrics:
+    # Zbiorcze czasy etapów z wielu analiz (daemon, batch), zapisywane jako plik tekstowy w formacie Prometheus
+    def __init__(self, buckets: tuple[float, ...] = _default_buckets):
+        self.buckets = buckets
+        self.lock = Lock()
+        self.write_lock = Lock()
+        self.frames = 0
+        self.errors = 0
+        self.stages = {}
+        # Liczba obrazów, na które odpowiedział każdy etap triage ('coarse' lub 'full')
+        self.triage_tiers = {}
+        # Funkcje zwracające dodatkowe linie pliku metryk (np. FramePipeline.get_metric_lines)
+        self.collectors = []
+        self.last_write = monotonic()
+
+    def observe(self, output: dict) -> None:
+        with self.lock:
+            self.frames += 1
+            if output.get('error msg') is not None:
+                self.errors += 1
+            tier = output.get('triage', {}).get('tier')
+            if tier is not None:
+                self.triage_tiers[tier] = self.triage_tiers.get(tier, 0) + 1
+            for name, timing in output.get('stage timings', {}).items():
+                if name not in self.stages:
+                    self.stages[name] = {'count': 0, 'wall': 0., 'cpu': 0., 'buckets': [0] * len(self.buckets)}
+                stage = self.stages[name]
+                wall = timing['wall ms'] / 1000
+                stage['count'] += 1
+                stage['wall'] += wall
+                stage['cpu'] += timing['cpu ms'] / 1000
+                for i, bound in enumerate(self.buckets):
+                    if wall <= bound:
+                        stage['buckets'][i] += 1
+
+    def get_text(self) -> str:
+        with self.lock:
+            lines = [
+                '# HELP {}_frames_total Number of analyzed frames'.format(_metrics_prefix),
+                '# TYPE {}_frames_total counter'.format(_metrics_prefix),
+                '{}_frames_total {}'.format(_metrics_prefix, self.frames),
+                '# HELP {}_errors_total Number of frames that could not be analyzed'.format(_metrics_prefix),
+                '# TYPE {}_errors_total counter'.format(_metrics_prefix),
+                '{}_errors_total {}'.format(_metrics_prefix, self.errors),
+                '# HELP {}_stage_wall_seconds Wall time of each analysis stage'.format(_metrics_prefix),
+                '# TYPE {}_stage_wall_seconds histogram'.format(_metrics_prefix)
+            ]
+            for name, stage in sorted(self.stages.items()):
+                for bound, count in zip(self.buckets, stage['buckets']):
+                    lines.append('{}_stage_wall_seconds_bucket{{stage="{}",le="{}"}} {}'.format(_metrics_prefix, name, bound, count))
+                lines.append('{}_stage_wall_seconds_bucket{{stage="{}",le="+Inf"}} {}'.format(_metrics_prefix, name, stage['count']))
+                lines.append('{}_stage_wall_seconds_sum{{stage="{}"}} {}'.format(_metrics_prefix, name, stage['wall']))
+                lines.append('{}_stage_wall_seconds_count{{stage="{}"}} {}'.format(_metrics_prefix, name, stage['count']))
+            lines.append('# HELP {}_stage_cpu_seconds_total CPU time of each analysis stage'.format(_metrics_prefix))
+            lines.append('# TYPE {}_stage_cpu_seconds_total counter'.format(_metrics_prefix))
+            for name, stage in sorted(self.stages.items()):
+                lines.append('{}_stage_cpu_seconds_total{{stage="{}"}} {}'.format(_metrics_prefix, name, stage['cpu']))
+            if self.triage_tiers:
+                lines.append('# HELP {}_triage_frames_total Number of frames answered by each triage tier'.format(_metrics_prefix))
+                lines.append('# TYPE {}_triage_frames_total counter'.format(_metrics_prefix))
+                for tier, count in sorted(self.triage_tiers.items()):
+                    lines.append('{}_triage_frames_total{{tier="{}"}} {}'.format(_metrics_prefix, tier, count))
+        for collector in self.collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+    def write(self, filename: str) -> None:
+        # Zapis do pliku tymczasowego i podmiana, żeby zbierający metryki nie przeczytał połowy pliku
+        with self.write_lock:
+            temporary_path = '{}.{}.tmp'.format(filename, getpid())
+            with open(temporary_path, 'w') as file:
+                file.write(self.get_text())
+            replace(temporary_path, filename)
+            self.last_write = monotonic()
+
+    def write_if_due(self, filename: str, interval: float) -> None:
+        if monotonic() - self.last_write >= interval:
+            self.write(filename)
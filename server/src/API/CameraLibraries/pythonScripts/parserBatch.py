@@ -0,0 +1,104 @@
+from communicator import analyze_frame
+from instrumentation import StageMetrics
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from glob import glob
+from json import dumps as to_json, loads as from_json
+from os import cpu_count, listdir
+from os.path import isdir, isfile, join, normpath
+from sys import stdout
+from time import perf_counter
+
+image_extensions = ('.jpg', '.jpeg', '.png', '.bmp')
+
+def get_batch_files(source: str) -> list[str]:
+    # Źródłem może być folder (wszystkie obrazy w nim) lub wzorzec glob, np. ExampleImages/flir_*.jpg
+    if isdir(source):
+        files = [join(source, name) for name in listdir(source) if name.lower().endswith(image_extensions)]
+    else:
+        files = glob(source)
+    return sorted(normpath(file) for file in files if isfile(file))
+
+def get_processed_files(output_filename: str) -> set[str]:
+    # Pliki z poprawnym wynikiem w istniejącym wyjściu są pomijane przy wznawianiu przerwanej analizy
+    processed = set()
+    if not isfile(output_filename):
+        return processed
+    with open(output_filename, 'r') as file:
+        for line in file:
+            try:
+                record = from_json(line)
+            except ValueError:
+                # Ostatnia linia mogła zostać ucięta przy przerwaniu
+                continue
+            if record.get('error msg') is None:
+                processed.add(record['filename'])
+    return processed
+
+def ends_with_newline(filename: str) -> bool:
+    with open(filename, 'rb') as file:
+        if file.seek(0, 2) == 0:
+            return True
+        file.seek(-1, 2)
+        return file.read(1) == b'\n'
+
+def analyze_file(filename: str) -> dict:
+    record = {
+        'filename': filename,
+        'hottest temperature': None,
+        'percentage': None,
+        'timings': {},
+        'error msg': None
+    }
+    start = perf_counter()
+    try:
+        with open(filename, 'rb') as file:
+            image_bytes = file.read()
+    except IOError as error:
+        record['error msg'] = '{}: {}'.format(type(error).__name__, error)
+        return record
+    read_end = perf_counter()
+    output = analyze_frame(image_bytes)
+    record['timings']['read'] = read_end - start
+    record['timings']['analysis'] = perf_counter() - read_end
+    record.update(output)
+    return record
+
+def run_batch(source: str, output_filename: str | None = None, workers: int | None = None, metrics_file: str | None = None, metrics_interval: float = 10.) -> dict:
+    files = get_batch_files(source)
+    summary = {
+        'total': len(files),
+        'skipped': 0,
+        'processed': 0,
+        'errors': 0
+    }
+    if output_filename is not None:
+        processed = get_processed_files(output_filename)
+        files = [file for file in files if file not in processed]
+        summary['skipped'] = summary['total'] - len(files)
+        output = open(output_filename, 'a')
+        # Dopisywanie po uciętej linii zepsułoby kolejny rekord
+        if not ends_with_newline(output_filename):
+            output.write('\n')
+    else:
+        output = stdout
+    metrics = StageMetrics() if metrics_file is not None else None
+    try:
+        with ProcessPoolExecutor(max_workers = workers or cpu_count()) as pool:
+            futures = [pool.submit(analyze_file, file) for file in files]
+            # Wyniki zapisywane w kolejności ukończenia, a nie w kolejności plików
+            for future in as_completed(futures):
+                record = future.result()
+                output.write(to_json(record) + '\n')
+                output.flush()
+                summary['processed'] += 1
+                if record['error msg'] is not None:
+                    summary['errors'] += 1
+                if metrics is not None:
+                    metrics.observe(record)
+                    metrics.write_if_due(metrics_file, metrics_interval)
+    finally:
+        if output is not stdout:
+            output.close()
+        if metrics is not None:
+            metrics.write(metrics_file)
+    return summary
\ No newline at end of file
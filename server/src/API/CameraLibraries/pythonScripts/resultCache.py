@@ -0,0 +1,95 @@
+from collections import OrderedDict
+from hashlib import blake2b
+from json import dumps as to_json, loads as from_json
+from os import makedirs, replace, getpid
+from os.path import join, isfile
+from threading import Lock, get_ident
+
+_default_max_entries = 256
+_default_max_bytes = 16 * 1024 * 1024
+
+def get_cache_key(image_bytes: bytes, fingerprint: str) -> str:
+    # Skrót bajtów obrazu razem z konfiguracją, bo ten sam obraz z innymi ustawieniami daje inny wynik
+    key = blake2b(digest_size = 16)
+    key.update(fingerprint.encode())
+    key.update(image_bytes)
+    return key.hexdigest()
+
+class ResultCache:
+    # Wyniki analizy identycznych obrazów: LRU w pamięci ograniczone liczbą wpisów i bajtów oraz opcjonalnie folder na dysku,
+    # wspólny dla wszystkich procesów (np. pracowników daemona lub kolejnych uruchomień communicator.py).
+    # Może być używana z wielu wątków naraz (analiza wielu kamer)
+    def __init__(self, max_entries: int = _default_max_entries, max_bytes: int = _default_max_bytes, directory: str | None = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+        if directory is not None:
+            makedirs(directory, exist_ok = True)
+
+    def get(self, key: str) -> dict | None:
+        with self.lock:
+            serialized = self.entries.get(key)
+            if serialized is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+        if serialized is not None:
+            return from_json(serialized)
+        serialized = self.read_from_disk(key)
+        try:
+            output = from_json(serialized) if serialized is not None else None
+        except ValueError:
+            output = None
+        with self.lock:
+            if output is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self.store_in_memory(key, serialized)
+        return output
+
+    def put(self, key: str, output: dict) -> None:
+        serialized = to_json(output)
+        self.store_in_memory(key, serialized)
+        if self.directory is not None:
+            # Zapis do pliku tymczasowego i podmiana, żeby inny proces nie przeczytał połowy wpisu
+            path = join(self.directory, key + '.json')
+            temporary_path = '{}.{}.{}.tmp'.format(path, getpid(), get_ident())
+            with open(temporary_path, 'w') as file:
+                file.write(serialized)
+            replace(temporary_path, path)
+
+    def store_in_memory(self, key: str, serialized: str) -> None:
+        with self.lock:
+            if key in self.entries:
+                self.size -= len(self.entries.pop(key))
+            if len(serialized) > self.max_bytes:
+                return
+            self.entries[key] = serialized
+            self.size += len(serialized)
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last = False)
+                self.size -= len(evicted)
+
+    def read_from_disk(self, key: str) -> str | None:
+        if self.directory is None:
+            return None
+        path = join(self.directory, key + '.json')
+        if not isfile(path):
+            return None
+        try:
+            with open(path, 'r') as file:
+                return file.read()
+        except IOError:
+            return None
+
+    def get_counters(self) -> dict:
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses
+            }
\ No newline at end of file
@@ -0,0 +1,132 @@
+from requests import Session, RequestException
+from requests.adapters import HTTPAdapter
+from queue import Queue, Empty, Full
+from threading import Thread, Lock
+from time import monotonic, sleep
+from sys import stderr
+
+_default_batch_size = 16
+_default_batch_delay = 0.5
+_default_timeout = 10.
+_default_retries = 3
+_default_queue_size = 1000
+_default_pool_size = 4
+
+def create_session(pool_size: int = _default_pool_size) -> Session:
+    # Sesja utrzymuje otwarte połączenia z serwerem, zamiast łączyć się od nowa przy każdym wyniku
+    session = Session()
+    adapter = HTTPAdapter(pool_connections = pool_size, pool_maxsize = pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def post_results(session: Session, endpoint_url: str, api_key: str, results: list[dict], timeout: float = _default_timeout, retries: int = _default_retries) -> bool:
+    payload = {
+        'api key': api_key,
+        'results': results
+    }
+    for attempt in range(retries + 1):
+        if attempt > 0:
+            sleep(min(2 ** (attempt - 1) * 0.5, 5.))
+        try:
+            response = session.post(endpoint_url, json = payload, timeout = timeout)
+        except RequestException as error:
+            print('Error while sending results: {}'.format(error), file = stderr)
+            continue
+        # Błędy serwera mogą minąć, błędy klienta (np. zły klucz API) już nie
+        if response.status_code < 400:
+            return True
+        if response.status_code < 500:
+            print('Results rejected by endpoint with status {}'.format(response.status_code), file = stderr)
+            return False
+    return False
+
+class ResultSender:
+    # Wysyła wyniki w tle, kilka naraz w jednym żądaniu POST z JSON {"api key": ..., "results": [...]}.
+    # send() nigdy nie czeka na sieć: jeśli kolejka jest pełna, wynik jest odrzucany i liczony w 'dropped'
+    def __init__(
+            self,
+            endpoint_url: str,
+            api_key: str,
+            batch_size: int = _default_batch_size,
+            batch_delay: float = _default_batch_delay,
+            timeout: float = _default_timeout,
+            retries: int = _default_retries,
+            queue_size: int = _default_queue_size,
+            session: Session | None = None
+    ):
+        self.endpoint_url = endpoint_url
+        self.api_key = api_key
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.timeout = timeout
+        self.retries = retries
+        self.session = session or create_session()
+        self.queue = Queue(queue_size)
+        self.counters = {
+            'sent': 0,
+            'failed': 0,
+            'dropped': 0,
+            'batches': 0
+        }
+        self.counters_lock = Lock()
+        self.closing = False
+        self.worker = Thread(target = self.run, name = 'ResultSender', daemon = True)
+        self.worker.start()
+
+    def send(self, output: dict) -> bool:
+        try:
+            self.queue.put_nowait(output)
+            return True
+        except Full:
+            self.count('dropped')
+            return False
+
+    def close(self, timeout: float | None = None) -> None:
+        # Wysyła to, co zostało w kolejce, i zatrzymuje wątek
+        self.closing = True
+        self.worker.join(timeout)
+        self.session.close()
+
+    def count(self, counter: str, amount: int = 1) -> None:
+        with self.counters_lock:
+            self.counters[counter] += amount
+
+    def get_counters(self) -> dict:
+        with self.counters_lock:
+            return self.counters.copy()
+
+    def collect_batch(self) -> list[dict]:
+        # Czeka na pierwszy wynik, a potem najwyżej batch_delay sekund na kolejne, do batch_size wyników
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            if deadline is None:
+                wait = 0.1
+            else:
+                wait = deadline - monotonic()
+                if wait <= 0:
+                    break
+            try:
+                batch.append(self.queue.get(timeout = wait))
+            except Empty:
+                if deadline is None and self.closing:
+                    break
+                continue
+            if deadline is None:
+                deadline = monotonic() + self.batch_delay
+        return batch
+
+    def post_batch(self, batch: list[dict]) -> bool:
+        self.count('batches')
+        return post_results(self.session, self.endpoint_url, self.api_key, batch, self.timeout, self.retries)
+
+    def run(self) -> None:
+        while not (self.closing and self.queue.empty()):
+            batch = self.collect_batch()
+            if not batch:
+                continue
+            if self.post_batch(batch):
+                self.count('sent', len(batch))
+            else:
+                self.count('failed', len(batch))
\ No newline at end of file
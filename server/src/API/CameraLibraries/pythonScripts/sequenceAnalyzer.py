@@ -0,0 +1,96 @@
+from thermalImageParser import AnalysisPlan, main as find_danger_percentage
+from numpy import ndarray, uint8, int16, minimum, maximum, array_equal
+from threading import Lock
+from typing import BinaryIO
+
+_default_tolerance = 0
+_default_full_recompute_interval = 30
+_grid_step = 8
+# Pola wyniku opisujące jedno wywołanie main, więc nie są przenoszone na klatki z wynikiem użytym ponownie
+_per_call_output_keys = ('stage timings', 'triage')
+
+def get_area_slices(plan: AnalysisPlan) -> list[tuple[slice, slice]]:
+    # Prostokąty obszarów roboczych tak jak w get_work_area_mask - razem pokrywają każdy piksel maski
+    return [(slice(max(area[0][1] - 1, 0), area[1][1]), slice(max(area[0][0] - 1, 0), area[1][0])) for area in plan.work_areas]
+
+class SequenceAnalyzer:
+    # Analiza kolejnych klatek z jednej kamery. Klatka, której obszary robocze różnią się od klatki wzorcowej najwyżej
+    # o tolerance poziomów szarości (a pasek palety daje tę samą skalę), dostaje wynik klatki wzorcowej bez analizy,
+    # np. gdy poza obszarami zmienia się tylko znak czasu. Pozostałe klatki analizowane są przez thermalImageParser.main,
+    # ze wszystkimi opcjami, i stają się klatką wzorcową. Przy tolerance = 0 wynik jest identyczny z main.
+    # Wzorzec nie zmienia się przy ponownym użyciu, więc małe zmiany się nie kumulują, a po full_recompute_interval
+    # kolejnych ponownie użytych wynikach klatka jest analizowana mimo wszystko.
+    # Klatki bez zdekodowanego obrazu (surowe dane czujnika, profilowanie) oraz z mapą temperatur analizowane są zawsze.
+    # Może być używany z wielu wątków naraz (etap analizy potoku --stream)
+    def __init__(self, plan: AnalysisPlan, tolerance: int = _default_tolerance, full_recompute_interval: int = _default_full_recompute_interval):
+        self.plan = plan
+        self.tolerance = tolerance
+        self.full_recompute_interval = full_recompute_interval
+        self.lock = Lock()
+        self.reference = None
+        self.reused_since_full = 0
+
+    def get_bounds(self, reference: dict, area_slices: list[tuple[slice, slice]]) -> list[tuple[ndarray, ndarray]]:
+        # Najmniejsza i największa wartość każdego piksela obszarów, przy której klatka nadal pasuje do wzorca.
+        # Liczone dopiero, gdy klatka przejdzie sprawdzenie na rzadkiej siatce, więc przy ruchomej scenie wcale
+        if reference['bounds'] is None:
+            regions = [reference['image'][area] for area in area_slices]
+            reference['bounds'] = [(maximum(region, self.tolerance) - self.tolerance, minimum(region, 255 - self.tolerance) + self.tolerance) for region in regions]
+        return reference['bounds']
+
+    def differs(self, region: uint8, reference_region: uint8) -> bool:
+        if self.tolerance == 0:
+            return not array_equal(region, reference_region)
+        return bool((abs(region.astype(int16) - reference_region) > self.tolerance).any())
+
+    def matches(self, reference: dict, image_arr: uint8, scale_pixel_range: tuple[int, int], area_slices: list[tuple[slice, slice]]) -> bool:
+        if reference['shape'] != image_arr.shape or reference['scale pixel range'] != scale_pixel_range:
+            return False
+        # Najpierw co _grid_step piksel w obu kierunkach, co przy zmienionej klatce zwykle wystarcza za cały test
+        grid = (slice(None, None, _grid_step), slice(None, None, _grid_step))
+        for area in area_slices:
+            if self.differs(image_arr[area][grid], reference['image'][area][grid]):
+                return False
+        if self.tolerance == 0:
+            return not any(self.differs(image_arr[area], reference['image'][area]) for area in area_slices)
+        for area, (low, high) in zip(area_slices, self.get_bounds(reference, area_slices)):
+            region = image_arr[area]
+            if (region < low).any() or (region > high).any():
+                return False
+        return True
+
+    def analyze(self, filename: str | bytes | BinaryIO, arguments: dict) -> dict:
+        # arguments jak dla thermalImageParser.main, z planem tego analizatora. Obraz musi już być zdekodowany
+        # (arguments['decoded'], tak jak w communicator.prepare_analysis), inaczej klatka jest po prostu analizowana
+        decoded = arguments.get('decoded')
+        if decoded is None or decoded.image_arr is None or arguments.get('return_temperature_map') or arguments.get('save_temperature_map') is not None:
+            return find_danger_percentage(filename, **arguments)
+        image_arr = decoded.image_arr
+        with decoded.timer.stage('change detection'):
+            plan = self.plan.get_scaled_plan((image_arr.shape[1], image_arr.shape[0]))
+            area_slices = get_area_slices(plan)
+            scale_pixel_range = plan.get_scale_pixel_range(image_arr)
+            with self.lock:
+                reference = self.reference if self.reused_since_full < self.full_recompute_interval else None
+            reused = reference is not None and self.matches(reference, image_arr, scale_pixel_range, area_slices)
+        if reused:
+            with self.lock:
+                self.reused_since_full += 1
+            output = dict(reference['output'])
+            if arguments['timings']:
+                output['stage timings'] = decoded.timer.get_timings()
+        else:
+            output = find_danger_percentage(filename, **arguments)
+            # Obraz klatki wzorcowej nie jest kopiowany - zdekodowana tablica nie jest potem zmieniana
+            reference = {
+                'shape': image_arr.shape,
+                'scale pixel range': scale_pixel_range,
+                'image': image_arr,
+                'bounds': None,
+                'output': {name: value for name, value in output.items() if name not in _per_call_output_keys}
+            }
+            with self.lock:
+                self.reference = reference
+                self.reused_since_full = 0
+        output['reused'] = reused
+        return output
@@ -1,6 +1,15 @@
 from PIL import Image
-from numpy import uint8
+from numpy import uint8, int16, int32, int64, float32, bool_, arange, ix_, zeros, full, count_nonzero, bincount, ndarray, nonzero, argsort, searchsorted, minimum, maximum, ones, isnan as is_nan
+from math import ceil, isnan
 from os.path import isfile as file_exists
+from typing import BinaryIO
+from io import BytesIO
+from collections import OrderedDict
+from threading import Lock
+from temperatures import get_palette_lut, get_planck_lut, get_temperature_map, save_temperature_map as save_temperature_array
+from flirRadiometric import read_radiometric_data
+from frameTriage import get_triage_counters
+from instrumentation import StageTimer, FrameProfiler
 
 _default_image_size = (640, 480)
 _default_palette_bounds = ((620, 30), (635, 424))
@@ -10,29 +19,259 @@ _default_danger_temperature = 40.
 _default_danger_color = (255, 0, 0)
 _default_work_areas = [((2, 58), (585, 456))]
 _default_rounding = 2
+_default_decode_mode = 'fast'
+_disabled_timer = StageTimer(False)
 
-def get_image(filename: str, size: tuple[int, int]) -> uint8:
-    image = Image.open(filename).convert('RGB')
-    image = image.resize(size)
-    original_image_arr = uint8(image)
-    image = image.convert('L')
-    image_arr = uint8(image)
+def get_image(filename: str | bytes | BinaryIO, size: tuple[int, int], need_rgb: bool = True, decode_mode: str = _default_decode_mode, timer: StageTimer = _disabled_timer, resize: bool = True) -> tuple[uint8 | None, uint8]:
+    # Obraz może być podany jako ścieżka, plik lub bajty w pamięci. Bez resize obraz zostaje w rozdzielczości po dekodowaniu
+    # (duże JPEG w trybach 'fast' i 'luma' są nadal zmniejszane przy dekodowaniu, ale nie poniżej size)
+    if isinstance(filename, (bytes, bytearray, memoryview)):
+        filename = BytesIO(filename)
+    if decode_mode == 'full':
+        with timer.stage('decode'):
+            image = Image.open(filename).convert('RGB')
+        if resize:
+            with timer.stage('resize'):
+                image = image.resize(size)
+        with timer.stage('grayscale'):
+            original_image_arr = uint8(image)
+            image = image.convert('L')
+            image_arr = uint8(image)
+        return original_image_arr, image_arr
+    if decode_mode not in ('fast', 'luma'):
+        raise ValueError('Unknown decode mode \"{}\"'.format(decode_mode))
+    # Tryb 'fast': tablica RGB tworzona tylko, jeśli jest potrzebna, duże JPEG zmniejszane już przy dekodowaniu (draft),
+    # a resize pomijany, jeśli obraz ma już właściwy rozmiar. Dla obrazów o rozmiarze size wynik jest identyczny z 'full',
+    # dla zmniejszanych odcienie szarości różnią się zwykle o kilka poziomów (na przykładowych obrazach najwyżej o 16).
+    # Tryb 'luma': JPEG dekodowany od razu w odcieniach szarości (tylko kanał Y), bez konwersji kolorów.
+    # Najszybszy, ale w nasyconych kolorach palety różni się od 'full' nawet o 30 poziomów
+    mode = 'L' if decode_mode == 'luma' and not need_rgb else 'RGB'
+    with timer.stage('decode'):
+        image = Image.open(filename)
+        if image.format == 'JPEG':
+            image.draft(mode, tuple(size))
+        image = image.convert(mode)
+    if resize and image.size != tuple(size):
+        with timer.stage('resize'):
+            image = image.resize(size)
+    with timer.stage('grayscale'):
+        original_image_arr = uint8(image) if need_rgb else None
+        if mode == 'RGB':
+            image = image.convert('L')
+        image_arr = uint8(image)
     return original_image_arr, image_arr
 
 def get_rounded_mean(data: list) -> int:
-    return round(sum(data)/len(data))
-
-def get_working_area(x: int, y: int, work_areas: list[tuple[tuple[int, int], tuple[int, int]]]) -> int:
-    for i in range(len(work_areas)):
-        if x >= work_areas[i][0][0] - 1 and x < work_areas[i][1][0] and y >= work_areas[i][0][1] - 1 and y < work_areas[i][1][1]:
-            return i
-    return -1
+    # Sumowanie jako int, bo suma wartości uint8 się przepełnia
+    return round(sum(int(value) for value in data)/len(data))
 
 def get_start_palette(scale_pixel_range: tuple[int, int], temperature_range: tuple[float, float], danger_temperature: float) -> int:
     danger_start = (scale_pixel_range[1] - scale_pixel_range[0]) * (danger_temperature - temperature_range[0]) / (temperature_range[1] - temperature_range[0]) + scale_pixel_range[0]
     return danger_start
 
-def count_danger_pixels(image_arr: uint8, palette_start: int, scale_pixel_range: tuple[int, int], temperature_range: tuple[int, int], work_areas: list[tuple[tuple[int, int], tuple[int, int]]], rounding : int) -> tuple[float, float]:
+class AnalysisPlan:
+    # Wszystko co da się wyliczyć z samej konfiguracji, liczone raz zamiast dla każdego obrazu
+    def __init__(
+            self,
+            image_size: tuple[int, int],
+            palette_bounds: tuple[tuple[int, int], tuple[int, int]],
+            temperature_range: tuple[float, float],
+            danger_temp: float,
+            work_areas: list[tuple[tuple[int, int], tuple[int, int]]]
+    ):
+        self.image_size = tuple(image_size)
+        self.palette_bounds = tuple(tuple(point) for point in palette_bounds)
+        self.temperature_range = tuple(temperature_range)
+        self.danger_temp = danger_temp
+        self.work_areas = tuple(tuple(tuple(point) for point in area) for area in work_areas)
+        # Obszar poza obrazem dałby po cichu 0% gorących pikseli, a wersja referencyjna kończy się wtedy IndexError
+        for area in self.work_areas:
+            if not all(0 <= area[0][i] <= area[1][i] <= self.image_size[i] and area[1][i] >= 1 for i in range(2)):
+                raise ValueError('Work area {} does not fit in image of size {}'.format(area, self.image_size))
+        # Tablice zależą tylko od rozmiaru obrazu i obszarów roboczych, więc plany różniące się progami temperatur je dzielą
+        geometry = get_plan_geometry(self.image_size, self.work_areas)
+        self.label_map = geometry.label_map
+        self.work_area_mask = geometry.work_area_mask
+        self.total_working_area = geometry.total_working_area
+        self.label_offsets = geometry.label_offsets
+        self.palette_columns = slice(self.palette_bounds[0][0], self.palette_bounds[1][0] + 1)
+        # Wiersze końców paska palety. W planach z get_scaled_plan może to być kilka wierszy z wagami (palette_row_weights)
+        self.palette_low_rows = slice(self.palette_bounds[1][1], self.palette_bounds[1][1] + 1)
+        self.palette_high_rows = slice(self.palette_bounds[0][1], self.palette_bounds[0][1] + 1)
+        self.palette_row_weights = None
+        # Plan, w którego współrzędnych podawane są wyniki (dla planów z get_scaled_plan - plan z konfiguracji)
+        self.reference = self
+        self.scaled_plans = OrderedDict()
+
+    def get_scaled_plan(self, size: tuple[int, int]) -> 'AnalysisPlan':
+        # Plan dla obrazu analizowanego w innej rozdzielczości: obszary robocze i pasek palety przeliczone na jego piksele,
+        # liczony raz dla każdego rozmiaru zamiast skalowania każdego obrazu do image_size. Plan jest wspólny dla wątków,
+        # a rozdzielczości przychodzących obrazów nie są ograniczone, więc pamiętane są tylko ostatnie (get_lru_entry)
+        size = tuple(size)
+        if size == self.image_size:
+            return self
+        return get_lru_entry(self.scaled_plans, size, _scaled_plan_cache_size, lambda: self.create_scaled_plan(size))
+
+    def create_scaled_plan(self, size: tuple[int, int]) -> 'AnalysisPlan':
+        scale = (size[0] / self.image_size[0], size[1] / self.image_size[1])
+        work_areas = []
+        for area in self.work_areas:
+            # Krawędzie obszaru (pierwszy piksel to area[0] - 1, ostatni area[1]) przeliczane są jak współrzędne ciągłe
+            start = [round(max(area[0][i] - 1, 0) * scale[i]) for i in range(2)]
+            end = [min(max(round(area[1][i] * scale[i]), start[i] + 1), size[i]) for i in range(2)]
+            work_areas.append(((start[0] + 1, start[1] + 1), (end[0], end[1])))
+        # Kolumny paska palety przeliczane są jak obszar. Wiersz końca paska leży często na jego krawędzi, więc zamiast
+        # jednego wiersza odczytywana jest średnia wierszy, które zajmuje on w tej rozdzielczości, ważona ich częścią wspólną
+        # z tym wierszem - tak jak uśredniłoby je skalowanie obrazu
+        first_column = round(self.palette_bounds[0][0] * scale[0])
+        last_column = max(round((self.palette_bounds[1][0] + 1) * scale[0]), first_column + 1) - 1
+        low_rows, low_weights = get_scaled_rows(self.palette_bounds[1][1], scale[1], size[1])
+        high_rows, high_weights = get_scaled_rows(self.palette_bounds[0][1], scale[1], size[1])
+        plan = AnalysisPlan(size, ((first_column, high_rows.start), (last_column, low_rows.start)), self.temperature_range, self.danger_temp, work_areas)
+        plan.palette_low_rows = low_rows
+        plan.palette_high_rows = high_rows
+        plan.palette_row_weights = (low_weights, high_weights)
+        plan.reference = self
+        return plan
+
+    def get_scaled_pixel_count(self, pixels: int) -> int:
+        # Liczba pikseli podana dla image_size planu z konfiguracji (np. FIRE_REGION_MIN_PIXELS) przeliczona na ten plan
+        if self.reference is self:
+            return pixels
+        return max(round(pixels * self.image_size[0] * self.image_size[1] / (self.reference.image_size[0] * self.reference.image_size[1])), 1)
+
+    def get_reference_pixel_count(self, pixels: int) -> int:
+        # Odwrotnie: liczba pikseli tego planu przeliczona na piksele planu z konfiguracji, w których podawane są wyniki
+        if self.reference is self:
+            return pixels
+        return round(pixels * self.reference.image_size[0] * self.reference.image_size[1] / (self.image_size[0] * self.image_size[1]))
+
+    def get_scale_pixel_range(self, image_arr: uint8) -> tuple[int, int]:
+        if self.palette_row_weights is not None:
+            return (
+                round(float(self.palette_row_weights[0] @ image_arr[self.palette_low_rows, self.palette_columns].mean(axis = 1))),
+                round(float(self.palette_row_weights[1] @ image_arr[self.palette_high_rows, self.palette_columns].mean(axis = 1)))
+            )
+        return (
+            get_rounded_mean(image_arr[self.palette_low_rows, self.palette_columns].ravel()),
+            get_rounded_mean(image_arr[self.palette_high_rows, self.palette_columns].ravel())
+        )
+
+def get_scaled_rows(row: int, scale: float, height: int) -> tuple[slice, ndarray]:
+    # Wiersze obrazu przeskalowanego o scale pokrywające wiersz row i udział każdego z nich (suma udziałów to 1)
+    top, bottom = row * scale, (row + 1) * scale
+    first = min(int(top), height - 1)
+    rows = arange(first, min(max(ceil(bottom), first + 1), height))
+    weights = minimum(rows + 1, bottom) - maximum(rows, top)
+    weights = weights.clip(0) if weights.clip(0).sum() > 0 else ones(len(rows))
+    return slice(int(rows[0]), int(rows[-1]) + 1), weights / weights.sum()
+
+class PlanGeometry:
+    # Część planu zależna tylko od rozmiaru obrazu i obszarów roboczych. Tablice są tylko do odczytu, bo dzieli je wiele planów
+    def __init__(self, image_size: tuple[int, int], work_areas: tuple[tuple[tuple[int, int], tuple[int, int]], ...]):
+        # Mapa obszarów: numer pierwszego obszaru zawierającego piksel (tak jak kiedyś get_working_area) lub -1
+        self.label_map = full((image_size[1], image_size[0]), -1, dtype = int16)
+        for i in reversed(range(len(work_areas))):
+            area = work_areas[i]
+            self.label_map[max(area[0][1] - 1, 0):area[1][1], max(area[0][0] - 1, 0):area[1][0]] = i
+        self.work_area_mask = self.label_map >= 0
+        # Nakładające się obszary liczone są tylko raz
+        self.total_working_area = int(count_nonzero(self.work_area_mask))
+        # Numer obszaru każdego piksela z maski przesunięty o 256, do liczenia histogramów wszystkich obszarów naraz
+        self.label_offsets = self.label_map[self.work_area_mask].astype(int32) * 256
+        for array in (self.label_map, self.work_area_mask, self.label_offsets):
+            array.flags.writeable = False
+
+# Pamięć podręczna geometrii i planów ograniczona do ostatnio używanych wpisów, bo daemon dostaje w profilach dowolne progi
+# i obszary, a geometria obrazu 640x480 zajmuje około 2 MB
+_geometry_cache_size = 8
+_plan_cache_size = 32
+_scaled_plan_cache_size = 4
+_geometry_cache = OrderedDict()
+_plan_cache = OrderedDict()
+_cache_lock = Lock()
+
+def get_lru_entry(cache: OrderedDict, key, size: int, create):
+    with _cache_lock:
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+    # Tworzenie poza blokadą, żeby długie liczenie nie wstrzymywało innych wątków. Przy wyścigu zostaje pierwszy wpis
+    value = create()
+    with _cache_lock:
+        value = cache.setdefault(key, value)
+        cache.move_to_end(key)
+        while len(cache) > size:
+            cache.popitem(last = False)
+    return value
+
+def get_plan_geometry(image_size: tuple[int, int], work_areas: list[tuple[tuple[int, int], tuple[int, int]]]) -> PlanGeometry:
+    key = (tuple(image_size), tuple(tuple(tuple(point) for point in area) for area in work_areas))
+    return get_lru_entry(_geometry_cache, key, _geometry_cache_size, lambda: PlanGeometry(*key))
+
+def get_plan_key(
+        image_size: tuple[int, int],
+        palette_bounds: tuple[tuple[int, int], tuple[int, int]],
+        temperature_range: tuple[float, float],
+        danger_temp: float,
+        work_areas: list[tuple[tuple[int, int], tuple[int, int]]]
+) -> tuple:
+    return (
+        tuple(image_size),
+        tuple(tuple(point) for point in palette_bounds),
+        tuple(float(temp) for temp in temperature_range),
+        float(danger_temp),
+        tuple(tuple(tuple(point) for point in area) for area in work_areas)
+    )
+
+def get_analysis_plan(
+        image_size: tuple[int, int] = _default_image_size,
+        palette_bounds: tuple[tuple[int, int], tuple[int, int]] = _default_palette_bounds,
+        temp_min: float = _default_min_temp,
+        temp_max: float = _default_max_temp,
+        danger_temp: float = _default_danger_temperature,
+        work_areas: list[tuple[tuple[int, int], tuple[int, int]]] = _default_work_areas
+) -> AnalysisPlan:
+    key = get_plan_key(image_size, palette_bounds, (temp_min, temp_max), danger_temp, work_areas)
+    return get_lru_entry(_plan_cache, key, _plan_cache_size, lambda: AnalysisPlan(image_size, palette_bounds, (temp_min, temp_max), danger_temp, work_areas))
+
+def get_area_region(image_arr: uint8, area: tuple[tuple[int, int], tuple[int, int]]) -> uint8:
+    # Obszar obejmuje piksele od (x1 - 1, y1 - 1) do (x2 - 1, y2 - 1) włącznie, tak samo jak pętla w count_danger_pixels_reference.
+    # Ujemny indeks początkowy zawija się na drugi koniec obrazu, więc wtedy zamiast wycinka trzeba użyć indeksów
+    if area[0][0] >= 1 and area[0][1] >= 1:
+        return image_arr[area[0][1] - 1:area[1][1], area[0][0] - 1:area[1][0]]
+    return image_arr[ix_(arange(area[0][1] - 1, area[1][1]), arange(area[0][0] - 1, area[1][0]))]
+
+def count_danger_pixels(image_arr: uint8, palette_start: int, scale_pixel_range: tuple[int, int], temperature_range: tuple[int, int], work_areas: list[tuple[tuple[int, int], tuple[int, int]]], rounding : int, use_reference: bool = False, plan: AnalysisPlan | None = None) -> tuple[float, float]:
+    if use_reference:
+        return count_danger_pixels_reference(image_arr, palette_start, scale_pixel_range, temperature_range, work_areas, rounding)
+    if plan is not None:
+        total_working_area = plan.total_working_area
+        total_dangerous_pixels = int(count_nonzero(plan.work_area_mask & (image_arr >= palette_start)))
+        hottest_pixel = int(image_arr.max(where = plan.work_area_mask, initial = 0))
+    else:
+        total_working_area = 0
+        total_dangerous_pixels = 0
+        hottest_pixel = 0
+        for area in work_areas:
+            total_working_area += (area[1][0] - area[0][0] + 1) * (area[1][1] - area[0][1] + 1)
+            region = get_area_region(image_arr, area)
+            if region.size == 0:
+                continue
+            total_dangerous_pixels += int(count_nonzero(region >= palette_start))
+            area_hottest = region.max()
+            if hottest_pixel < area_hottest:
+                hottest_pixel = area_hottest
+    if plan is not None:
+        hottest_temp = float(get_palette_lut(tuple(scale_pixel_range), plan.temperature_range)[hottest_pixel])
+    else:
+        hottest_temp = (temperature_range[1] - temperature_range[0]) * (hottest_pixel - scale_pixel_range[0]) / (scale_pixel_range[1] - scale_pixel_range[0]) + temperature_range[0]
+    total_dangerous_pixels *= 100
+    if rounding < 0:
+        return total_dangerous_pixels / total_working_area, hottest_temp
+    return round(total_dangerous_pixels / total_working_area, rounding), round(hottest_temp, rounding)
+
+def count_danger_pixels_reference(image_arr: uint8, palette_start: int, scale_pixel_range: tuple[int, int], temperature_range: tuple[int, int], work_areas: list[tuple[tuple[int, int], tuple[int, int]]], rounding : int) -> tuple[float, float]:
     total_working_area = 0
     total_dangerous_pixels = 0
     hottest_pixel = 0
@@ -50,27 +289,211 @@ def count_danger_pixels(image_arr: uint8, palette_start: int, scale_pixel_range:
         return total_dangerous_pixels / total_working_area, hottest_temp
     return round(total_dangerous_pixels / total_working_area, rounding), round(hottest_temp, rounding)
 
-def paint_danger_area(original_arr: uint8, image_arr: uint8, palette_start: int, work_areas: list[tuple[tuple[int, int], tuple[int, int]]], danger_color: tuple[int, int, int], image_size: tuple[int, int]) -> uint8:
-    new_arr = original_arr.copy()
-    area_arrs = []
+def get_area_histograms(image_arr: uint8, plan: AnalysisPlan) -> ndarray:
+    # Histogramy odcieni szarości każdego obszaru roboczego (wiersz na obszar) z jednego przejścia po pikselach
+    return bincount(plan.label_offsets + image_arr[plan.work_area_mask], minlength = len(plan.work_areas) * 256).reshape(len(plan.work_areas), 256)
+
+def get_palette_start_index(palette_start: float, levels: int = 256) -> int:
+    # Najmniejszy odcień spełniający warunek >= palette_start
+    if isnan(palette_start):
+        return levels
+    return min(max(ceil(palette_start), 0), levels)
+
+def count_alert_levels(histogram: ndarray, scale_pixel_range: tuple[int, int], temperature_range: tuple[float, float], alert_temps: list[float], total_working_area: int, rounding: int) -> list[dict]:
+    # Suma skumulowana od najjaśniejszego odcienia: pixels_from[v] to liczba pikseli o wartości >= v,
+    # więc każdy próg to jeden odczyt zamiast ponownego liczenia pikseli
+    pixels_from = zeros(len(histogram) + 1, dtype = int64)
+    pixels_from[:-1] = histogram[::-1].cumsum()[::-1]
+    levels = []
+    for alert_temp in alert_temps:
+        palette_start = get_start_palette(scale_pixel_range, temperature_range, alert_temp)
+        dangerous_pixels = int(pixels_from[get_palette_start_index(palette_start, len(histogram))])
+        percentage = dangerous_pixels * 100 / total_working_area
+        levels.append({
+            'temperature': alert_temp,
+            'percentage': percentage if rounding < 0 else round(percentage, rounding)
+        })
+    return levels
+
+def count_area_statistics(area_histograms: ndarray, palette_start: float, scale_pixel_range: tuple[int, int], temperature_range: tuple[float, float], work_areas: list[tuple[tuple[int, int], tuple[int, int]]], rounding: int) -> list[dict]:
+    # Piksel należy do pierwszego obszaru, który go zawiera, więc nakładające się fragmenty liczone są tylko raz.
+    # 95. percentyl to najmniejsza temperatura, od której nie jest cieplej co najmniej 95% pikseli obszaru
+    lut = get_palette_lut(tuple(scale_pixel_range), tuple(temperature_range))
+    pixels = area_histograms.sum(axis = 1)
+    dangerous_pixels = area_histograms[:, get_palette_start_index(palette_start):].sum(axis = 1)
+    hottest_values = 255 - (area_histograms[:, ::-1] > 0).argmax(axis = 1)
+    temperature_sums = area_histograms @ lut
+    cumulative = area_histograms.cumsum(axis = 1)
+    p95_values = (cumulative * 100 >= pixels[:, None] * 95).argmax(axis = 1)
+    round_value = (lambda value: value) if rounding < 0 else (lambda value: round(value, rounding))
+    statistics = []
+    for i in range(len(work_areas)):
+        area_statistics = {
+            'area': work_areas[i],
+            'pixels': int(pixels[i]),
+            'percentage': None,
+            'hottest temperature': None,
+            'mean temperature': None,
+            'p95 temperature': None
+        }
+        if pixels[i] > 0:
+            area_statistics['percentage'] = round_value(int(dangerous_pixels[i]) * 100 / int(pixels[i]))
+            area_statistics['hottest temperature'] = round_value(float(lut[hottest_values[i]]))
+            area_statistics['mean temperature'] = round_value(float(temperature_sums[i] / pixels[i]))
+            area_statistics['p95 temperature'] = round_value(float(lut[p95_values[i]]))
+        statistics.append(area_statistics)
+    return statistics
+
+def scale_regions(regions: list[dict], plan: AnalysisPlan, rounding: int) -> list[dict]:
+    # Obszary gorących pikseli z obrazu analizowanego według plan przeliczone na współrzędne i piksele planu z konfiguracji
+    if plan.reference is plan:
+        return regions
+    scale = (plan.reference.image_size[0] / plan.image_size[0], plan.reference.image_size[1] / plan.image_size[1])
+    round_value = (lambda value: value) if rounding < 0 else (lambda value: round(value, rounding))
+    for region in regions:
+        region['pixels'] = plan.get_reference_pixel_count(region['pixels'])
+        # Piksel przeliczany jest na piksel zawierający jego środek
+        region['bounding box'] = tuple(tuple(int((corner[i] + 0.5) * scale[i]) for i in range(2)) for corner in region['bounding box'])
+        region['centroid'] = tuple(round_value((region['centroid'][i] + 0.5) * scale[i] - 0.5) for i in range(2))
+    return regions
+
+def read_image_bytes(filename: str | bytes | BinaryIO) -> bytes:
+    if isinstance(filename, (bytes, bytearray, memoryview)):
+        return bytes(filename)
+    if isinstance(filename, str):
+        with open(filename, 'rb') as file:
+            return file.read()
+    return filename.read()
+
+class DecodedImage:
+    # Obraz po etapie dekodowania: surowe dane z czujnika FLIR albo tablice z get_image. Pozwala zdekodować obraz w innym wątku
+    # niż analiza (potok w communicator.py). Timer przechodzi razem z obrazem, więc czasy obu etapów trafiają do jednego wyniku
+    def __init__(self, radiometric_data: tuple[ndarray, tuple[tuple[str, float], ...]] | None, original_arr: uint8 | None, image_arr: uint8 | None, timer: StageTimer):
+        self.radiometric_data = radiometric_data
+        self.original_arr = original_arr
+        self.image_arr = image_arr
+        self.timer = timer
+
+def decode_image(
+        filename: str | bytes | BinaryIO,
+        plan: AnalysisPlan,
+        need_rgb: bool = False,
+        decode_mode: str = _default_decode_mode,
+        radiometric: bool = False,
+        timer: StageTimer = _disabled_timer,
+        resize: bool = True
+) -> DecodedImage:
+    # Przy radiometric temperatury brane są z surowych danych czujnika zapisanych w pliku przez kamerę FLIR, jeśli są dostępne.
+    # Obraz nie jest wtedy dekodowany ani skalowany
+    if radiometric:
+        with timer.stage('radiometric extraction'):
+            filename = read_image_bytes(filename)
+            radiometric_data = read_radiometric_data(filename)
+        if radiometric_data is not None:
+            return DecodedImage(radiometric_data, None, None, timer)
+    original_arr, image_arr = get_image(filename, plan.image_size, need_rgb, decode_mode, timer, resize)
+    return DecodedImage(None, original_arr, image_arr, timer)
+
+def get_temperature_counts(raw_values: ndarray, lut: ndarray) -> tuple[ndarray, ndarray]:
+    # Temperatury występujące wśród pikseli (rosnąco, bez nan) i liczba pikseli każdej - z histogramu surowych wartości,
+    # więc tablica temperatur nie jest tworzona dla każdego piksela
+    histogram = bincount(raw_values, minlength = len(lut))
+    present = nonzero(histogram)[0]
+    temperatures = lut[present]
+    valid = ~is_nan(temperatures)
+    order = argsort(temperatures[valid], kind = 'stable')
+    return temperatures[valid][order], histogram[present][valid][order]
+
+def count_pixels_from(temperatures: ndarray, counts: ndarray, temperature: float) -> int:
+    return int(counts[searchsorted(temperatures, temperature, 'left'):].sum())
+
+def analyze_radiometric(
+        raw_arr: ndarray,
+        calibration: tuple[tuple[str, float], ...],
+        plan: AnalysisPlan,
+        rounding: int,
+        alert_temps: list[float] | None,
+        area_statistics: bool,
+        fire_regions: bool,
+        fire_region_min_pixels: int,
+        timer: StageTimer = _disabled_timer
+) -> dict:
+    # Te same wyniki co z paska palety, ale z temperatur policzonych z surowych wartości czujnika.
+    # Obszary robocze podane dla obrazu o rozmiarze IMAGE_SIZE przeliczane są na rozmiar macierzy czujnika
+    round_value = (lambda value: value) if rounding < 0 else (lambda value: round(value, rounding))
+    lut = get_planck_lut(calibration)
+    with timer.stage('counting'):
+        sensor_plan = plan.get_scaled_plan((raw_arr.shape[1], raw_arr.shape[0]))
+        label_map = sensor_plan.label_map
+        work_area_mask = sensor_plan.work_area_mask
+        raw_values = raw_arr[work_area_mask]
+        temperatures, counts = get_temperature_counts(raw_values, lut)
+        output = {
+            'hottest temperature': round_value(float(temperatures[-1])) if len(temperatures) > 0 else None,
+            'percentage': round_value(count_pixels_from(temperatures, counts, plan.danger_temp) * 100 / raw_values.size),
+            'radiometric': True
+        }
+    if alert_temps:
+        with timer.stage('alert levels'):
+            output['alert levels'] = [{
+                'temperature': alert_temp,
+                'percentage': round_value(count_pixels_from(temperatures, counts, alert_temp) * 100 / raw_values.size)
+            } for alert_temp in alert_temps]
+    if area_statistics:
+        with timer.stage('area statistics'):
+            labels = label_map[work_area_mask]
+            output['work areas'] = []
+            for i in range(len(plan.work_areas)):
+                area_values = raw_values[labels == i]
+                statistics = {
+                    'area': plan.work_areas[i],
+                    'pixels': sensor_plan.get_reference_pixel_count(int(area_values.size)),
+                    'percentage': None,
+                    'hottest temperature': None,
+                    'mean temperature': None,
+                    'p95 temperature': None
+                }
+                area_temperatures, area_counts = get_temperature_counts(area_values, lut)
+                if len(area_temperatures) > 0:
+                    valid_pixels = int(area_counts.sum())
+                    statistics['percentage'] = round_value(count_pixels_from(area_temperatures, area_counts, plan.danger_temp) * 100 / area_values.size)
+                    statistics['hottest temperature'] = round_value(float(area_temperatures[-1]))
+                    statistics['mean temperature'] = round_value(float(area_temperatures @ area_counts / valid_pixels))
+                    statistics['p95 temperature'] = round_value(float(area_temperatures[(area_counts.cumsum() * 100 >= valid_pixels * 95).argmax()]))
+                output['work areas'].append(statistics)
+    if fire_regions:
+        from fireRegions import find_regions
+        with timer.stage('fire regions'):
+            danger_mask = work_area_mask & (lut >= plan.danger_temp)[raw_arr]
+            regions = find_regions(danger_mask, raw_arr, lut, rounding, min_pixels = sensor_plan.get_scaled_pixel_count(fire_region_min_pixels))
+            output['fire regions'] = scale_regions(regions, sensor_plan, rounding)
+    return output
+
+def get_area_maxima_bound(image_arr: uint8, plan: AnalysisPlan) -> int:
+    # Największy z najjaśniejszych pikseli prostokątów obszarów roboczych. Każdy piksel maski obszarów leży w którymś
+    # prostokącie, więc jest to dokładnie najjaśniejszy piksel obszarów, liczony na wycinkach bez maski całego obrazu
+    hottest_pixel = 0
+    for area in plan.work_areas:
+        region = image_arr[max(area[0][1] - 1, 0):area[1][1], max(area[0][0] - 1, 0):area[1][0]]
+        if region.size > 0:
+            hottest_pixel = max(hottest_pixel, int(region.max()))
+    return hottest_pixel
+
+def get_work_area_mask(work_areas: list[tuple[tuple[int, int], tuple[int, int]]], image_size: tuple[int, int]) -> bool_:
+    # Maska wszystkich obszarów roboczych, w których zaznaczane są gorące piksele
+    mask = zeros((image_size[1], image_size[0]), dtype = bool_)
     for area in work_areas:
-        area_arr = []
-        for y in range(area[0][1] - 1, area[1][1]):
-            line = []
-            for x in range(area[0][0] - 1, area[1][0]):
-                line.append(danger_color if image_arr[y][x] >= palette_start else original_arr[y][x])
-            area_arr.append(line)
-        area_arrs.append(area_arr)
-    for y in range(image_size[1]):
-        for x in range(image_size[0]):
-            area_id = get_working_area(x, y, work_areas)
-            if area_id < 0:
-                continue
-            new_arr[y][x] = area_arrs[area_id][y - work_areas[area_id][0][1] + 1][x - work_areas[area_id][0][0] + 1]
+        mask[max(area[0][1] - 1, 0):area[1][1], max(area[0][0] - 1, 0):area[1][0]] = True
+    return mask
+
+def paint_danger_area(original_arr: uint8, image_arr: uint8, palette_start: int, work_areas: list[tuple[tuple[int, int], tuple[int, int]]], danger_color: tuple[int, int, int], image_size: tuple[int, int], plan: AnalysisPlan | None = None) -> uint8:
+    work_area_mask = plan.work_area_mask if plan is not None else get_work_area_mask(work_areas, image_size)
+    new_arr = original_arr.copy()
+    new_arr[work_area_mask & (image_arr >= palette_start)] = danger_color
     return new_arr
 
 def main(
-        filename: str,
+        filename: str | bytes | BinaryIO,
         image_size: tuple[int, int] = _default_image_size,
         palette_bounds: tuple[tuple[int, int], tuple[int, int]] = _default_palette_bounds,
         temp_min: float = _default_min_temp,
@@ -81,27 +504,118 @@ def main(
         show_image: bool = True,
         print_result: bool = True,
         save_image: str | None = None,
-        rounding : int = _default_rounding
+        rounding : int = _default_rounding,
+        use_reference: bool = False,
+        plan: AnalysisPlan | None = None,
+        return_temperature_map: bool = False,
+        save_temperature_map: str | None = None,
+        alert_temps: list[float] | None = None,
+        area_statistics: bool = False,
+        decode_mode: str = _default_decode_mode,
+        fire_regions: bool = False,
+        fire_region_min_pixels: int = 1,
+        timings: bool = False,
+        profile: bool = False,
+        radiometric: bool = False,
+        decoded: DecodedImage | None = None,
+        native_resolution: bool = False,
+        triage: bool = False
 ) -> dict:
-    original_arr, image_arr = get_image(filename, image_size)
-    scale_pixel_range = (
-        get_rounded_mean(image_arr[palette_bounds[1][1]][palette_bounds[0][0]:palette_bounds[1][0] + 1]),
-        get_rounded_mean(image_arr[palette_bounds[0][1]][palette_bounds[0][0]:palette_bounds[1][0] + 1])
-    )
-    palette_start = get_start_palette(scale_pixel_range, (temp_min, temp_max), danger_temp)
-    if show_image or save_image != None:
-        new_image = Image.fromarray(paint_danger_area(original_arr, image_arr, palette_start, work_areas, danger_color, image_size), mode='RGB')
-        if show_image:
-            new_image.show()
-        if save_image != None:
-            new_image.saves(save_image)
-    percentage, hottest_temp = count_danger_pixels(image_arr, palette_start, scale_pixel_range, (temp_min, temp_max), work_areas, rounding)
-    if print_result:
-        print('Hottest temperature: {} C\nPercentage: {}%'.format(hottest_temp, percentage))
-    output = {
-        'hottest temperature': hottest_temp,
-        'percentage': percentage
-    }
+    # Podany plan zastępuje parametry konfiguracji
+    if plan is None:
+        plan = get_analysis_plan(image_size, palette_bounds, temp_min, temp_max, danger_temp, work_areas)
+    # Przy timings wynik zawiera czas każdego etapu, a przy profile także najdłużej działające funkcje i zużycie pamięci.
+    # Podany decoded (z decode_image z tymi samymi ustawieniami) zastępuje dekodowanie obrazu.
+    # Przy native_resolution obraz nie jest skalowany do image_size - obszary robocze i pasek palety przeliczane są raz
+    # na jego rozdzielczość, a współrzędne w wyniku podawane są nadal dla image_size.
+    # Przy triage najpierw sprawdzany jest tylko najjaśniejszy piksel obszarów (get_area_maxima_bound). Jeśli jest poniżej
+    # progu, obraz na pewno nie ma gorących pikseli, więc liczenie pomijane jest bez zmiany wyniku. Triage nie jest używany,
+    # gdy wynik potrzebuje histogramu lub wszystkich pikseli (alert temps, statystyki obszarów, obraz, mapa temperatur)
+    timer = StageTimer(timings) if decoded is None else decoded.timer
+    with FrameProfiler(profile) as profiler:
+        # Do pokazania lub zapisania obrazu potrzebny jest pasek palety, więc surowe dane z czujnika nie są wtedy używane
+        if decoded is None:
+            decoded = decode_image(filename, plan, show_image or save_image != None, decode_mode, radiometric and not (show_image or save_image != None), timer, not native_resolution)
+        if decoded.radiometric_data is not None:
+            raw_arr, calibration = decoded.radiometric_data
+            output = analyze_radiometric(raw_arr, calibration, plan, rounding, alert_temps, area_statistics, fire_regions, fire_region_min_pixels, timer)
+            if print_result:
+                print('Hottest temperature: {} C\nPercentage: {}%'.format(output['hottest temperature'], output['percentage']))
+            if return_temperature_map or save_temperature_map != None:
+                with timer.stage('temperature map'):
+                    temperature_map = get_temperature_map(raw_arr, get_planck_lut(calibration, float32))
+                    if return_temperature_map:
+                        output['temperature map'] = temperature_map
+                    if save_temperature_map != None:
+                        save_temperature_array(temperature_map, save_temperature_map)
+        else:
+            original_arr, image_arr = decoded.original_arr, decoded.image_arr
+            plan = plan.get_scaled_plan((image_arr.shape[1], image_arr.shape[0]))
+            with timer.stage('calibration'):
+                scale_pixel_range = plan.get_scale_pixel_range(image_arr)
+                palette_start = get_start_palette(scale_pixel_range, plan.temperature_range, plan.danger_temp)
+            if show_image or save_image != None:
+                with timer.stage('overlay'):
+                    new_image = Image.fromarray(paint_danger_area(original_arr, image_arr, palette_start, plan.work_areas, danger_color, plan.image_size, plan), mode='RGB')
+                if show_image:
+                    new_image.show()
+                if save_image != None:
+                    with timer.stage('save image'):
+                        new_image.save(save_image)
+            use_triage = triage and not (show_image or save_image != None or return_temperature_map or save_temperature_map != None or alert_temps or area_statistics or use_reference)
+            safe = False
+            if use_triage:
+                with timer.stage('triage'):
+                    hottest_pixel = get_area_maxima_bound(image_arr, plan)
+                    safe = hottest_pixel < get_palette_start_index(palette_start)
+            if safe:
+                # Te same wartości co z count_danger_pixels: zero gorących pikseli i ten sam najjaśniejszy piksel
+                percentage, hottest_temp = 0., float(get_palette_lut(scale_pixel_range, plan.temperature_range)[hottest_pixel])
+                if rounding >= 0:
+                    percentage, hottest_temp = round(percentage, rounding), round(hottest_temp, rounding)
+            else:
+                with timer.stage('counting'):
+                    percentage, hottest_temp = count_danger_pixels(image_arr, palette_start, scale_pixel_range, plan.temperature_range, plan.work_areas, rounding, use_reference, plan)
+            if print_result:
+                print('Hottest temperature: {} C\nPercentage: {}%'.format(hottest_temp, percentage))
+            output = {
+                'hottest temperature': hottest_temp,
+                'percentage': percentage
+            }
+            if use_triage:
+                output['triage'] = get_triage_counters().record('coarse' if safe else 'full', rounding)
+            if alert_temps or area_statistics:
+                with timer.stage('histograms'):
+                    area_histograms = get_area_histograms(image_arr, plan)
+            if alert_temps:
+                with timer.stage('alert levels'):
+                    histogram = area_histograms.sum(axis = 0)
+                    output['alert levels'] = count_alert_levels(histogram, scale_pixel_range, plan.temperature_range, alert_temps, plan.total_working_area, rounding)
+                    output['histogram'] = histogram.tolist()
+            if area_statistics:
+                with timer.stage('area statistics'):
+                    output['work areas'] = count_area_statistics(area_histograms, palette_start, scale_pixel_range, plan.temperature_range, plan.reference.work_areas, rounding)
+                    for statistics in output['work areas']:
+                        statistics['pixels'] = plan.get_reference_pixel_count(statistics['pixels'])
+            if fire_regions and safe:
+                output['fire regions'] = []
+            elif fire_regions:
+                from fireRegions import find_regions
+                with timer.stage('fire regions'):
+                    danger_mask = plan.work_area_mask & (image_arr >= palette_start)
+                    regions = find_regions(danger_mask, image_arr, get_palette_lut(scale_pixel_range, plan.temperature_range), rounding, min_pixels = plan.get_scaled_pixel_count(fire_region_min_pixels))
+                    output['fire regions'] = scale_regions(regions, plan, rounding)
+            if return_temperature_map or save_temperature_map != None:
+                with timer.stage('temperature map'):
+                    temperature_map = get_temperature_map(image_arr, get_palette_lut(scale_pixel_range, plan.temperature_range, float32))
+                    if return_temperature_map:
+                        output['temperature map'] = temperature_map
+                    if save_temperature_map != None:
+                        save_temperature_array(temperature_map, save_temperature_map)
+    if timings:
+        output['stage timings'] = timer.get_timings()
+    if profile:
+        output.update(profiler.get_results())
     return output
 
 if __name__ == '__main__':
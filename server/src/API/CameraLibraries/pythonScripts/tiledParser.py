@@ -0,0 +1,152 @@
+from numpy import memmap, load as load_array, ndarray, int64, arange, concatenate, lexsort, partition, nonzero, count_nonzero, searchsorted, empty
+from sys import argv
+from oldParser import get_temperature_lut, get_temperature_from_value, get_radius_mean, get_image_array, default_hotspot_distance
+
+# Analiza dużych klatek radiometrycznych w poziomych pasach: klatka czytana jest przez numpy.memmap (plik .npy albo surowe
+# wartości uint16), a w pamięci jest naraz tylko jeden pas i kilka tablic jego rozmiaru. Wyniki pasów łączone są dokładnie,
+# więc są takie same jak przy wczytaniu całej klatki w oldParser.find_hottest_pixel
+_default_tile_bytes = 4 * 1024 * 1024
+# Ile bajtów na piksel pasa mogą zająć tymczasowe tablice (kopia do partition, porównania, indeksy równych wartości) poza samym pasem
+_work_bytes_per_pixel = 12
+_raw_dtype = '<u2'
+_raw_extensions = ('.raw', '.bin')
+
+def open_frame(filename: str, shape: tuple[int, int] | None = None, offset: int = 0, dtype: str = _raw_dtype) -> ndarray:
+    # Plik .npy zawiera rozmiar w nagłówku, dla surowego pliku trzeba podać (szerokość, wysokość) i ewentualnie długość nagłówka.
+    # Inne pliki (16-bitowe PNG, TIFF) muszą zostać zdekodowane w całości, więc dla nich ograniczone jest tylko zużycie pamięci analizy
+    if filename.lower().endswith('.npy'):
+        return load_array(filename, mmap_mode = 'r')
+    if not filename.lower().endswith(_raw_extensions):
+        return get_image_array(filename, True)
+    if shape is None:
+        raise ValueError('Frame size is required for raw file \"{}\"'.format(filename))
+    return memmap(filename, dtype = dtype, mode = 'r', offset = offset, shape = (shape[1], shape[0]))
+
+def get_strip_height(frame: ndarray, tile_bytes: int) -> int:
+    return max(1, tile_bytes // (frame.shape[1] * (frame.dtype.itemsize + _work_bytes_per_pixel)))
+
+def get_disk_pixels(distance: int) -> int:
+    offsets = arange(-distance, distance + 1)
+    return int(count_nonzero(offsets[:, None]**2 + offsets[None, :]**2 <= distance**2))
+
+def get_top_candidates(values: ndarray, indices: ndarray, count: int) -> tuple[ndarray, ndarray]:
+    # count największych wartości, przy równych wartościach te o mniejszym indeksie - tak jak kolejne argmax na całej klatce
+    if values.size <= count:
+        order = lexsort((indices, -values.astype(int64)))
+        return values[order], indices[order]
+    threshold = partition(values, values.size - count)[values.size - count]
+    above = nonzero(values > threshold)[0]
+    equal = nonzero(values == threshold)[0]
+    equal = equal[lexsort((indices[equal],))][:count - above.size]
+    selected = concatenate((above, equal))
+    order = lexsort((indices[selected], -values[selected].astype(int64)))
+    return values[selected][order], indices[selected][order]
+
+def get_strip_candidates(values: ndarray, offset: int, count: int) -> tuple[ndarray, ndarray]:
+    # Jak get_top_candidates, ale bez tablicy indeksów wielkości pasa i bez sortowania - indeksy to pozycje w pasie plus offset
+    if values.size <= count:
+        positions = arange(values.size, dtype = int64)
+    else:
+        threshold = partition(values, values.size - count)[values.size - count]
+        above = nonzero(values > threshold)[0]
+        equal = nonzero(values == threshold)[0][:count - above.size]
+        positions = concatenate((above, equal))
+    return values[positions], positions + offset
+
+def select_hotspots(values: ndarray, indices: ndarray, width: int, count: int, distance: int) -> list[tuple[int, int]]:
+    # To samo co oldParser.find_hotspots, ale na posortowanej liście kandydatów zamiast na całej klatce
+    hotspots = []
+    for index in indices.tolist():
+        y, x = divmod(index, width)
+        if any((x - hx)**2 + (y - hy)**2 <= distance**2 for hx, hy in hotspots):
+            continue
+        hotspots.append((x, y))
+        if len(hotspots) == count:
+            break
+    return hotspots
+
+def get_frame_mean(frame: ndarray, strip_height: int) -> float:
+    total = 0
+    for top in range(0, frame.shape[0], strip_height):
+        total += int(frame[top:top + strip_height].sum(dtype = int64))
+    return total / frame.size
+
+def find_hottest_pixel_tiled(
+        frame: ndarray,
+        thermal_file = True,
+        temp_min = 0,
+        temp_max = 0,
+        radius = 0,
+        hotspot_count = 0,
+        hotspot_distance = default_hotspot_distance,
+        danger_temp: float | None = None,
+        tile_bytes: int = _default_tile_bytes
+) -> dict:
+    height, width = frame.shape
+    lut = get_temperature_lut(thermal_file, temp_min, temp_max)
+    strip_height = get_strip_height(frame, tile_bytes)
+    # Każdy wybrany gorący punkt wyklucza najwyżej get_disk_pixels(hotspot_distance) pikseli, więc n-ty punkt jest
+    # zawsze wśród (n - 1) * tyle + 1 największych pikseli klatki - tylu kandydatów wystarcza z każdego pasa
+    candidate_count = (max(hotspot_count, 1) - 1) * get_disk_pixels(hotspot_distance) + 1
+    # Tablica temperatur rośnie z wartością piksela, więc gorące piksele to te od pierwszej wartości o temperaturze >= danger_temp
+    danger_value = int(searchsorted(lut, danger_temp, 'left')) if danger_temp is not None else None
+    candidate_values = empty(0, dtype = frame.dtype)
+    candidate_indices = empty(0, dtype = int64)
+    danger_pixels = 0
+    for top in range(0, height, strip_height):
+        strip = frame[top:top + strip_height]
+        if danger_value is not None:
+            danger_pixels += int(count_nonzero(strip >= danger_value))
+        if candidate_count == 1:
+            index = int(strip.argmax())
+            values, indices = strip.reshape(-1)[index:index + 1], arange(index, index + 1, dtype = int64) + top * width
+        else:
+            values, indices = get_strip_candidates(strip.reshape(-1), top * width, candidate_count)
+        candidate_values, candidate_indices = get_top_candidates(concatenate((candidate_values, values)), concatenate((candidate_indices, indices)), candidate_count)
+    y, x = divmod(int(candidate_indices[0]), width)
+    center_pixel = (x, y)
+    output = {}
+    output['temperature'] = float(lut[frame[y, x]])
+    output['center pixel'] = center_pixel
+    output['radius temperature'] = output['temperature']
+    # get_radius_mean czyta tylko kwadrat wokół punktu, więc działa na memmap bez wczytywania klatki
+    if radius < 0:
+        output['radius temperature'] = get_temperature_from_value(get_frame_mean(frame, strip_height), thermal_file, temp_min, temp_max)
+    elif radius != 0:
+        output['radius temperature'] = get_temperature_from_value(get_radius_mean(frame, center_pixel, radius), thermal_file, temp_min, temp_max)
+    if hotspot_count > 0:
+        output['hotspots'] = []
+        for hotspot in select_hotspots(candidate_values, candidate_indices, width, hotspot_count, hotspot_distance):
+            temperature = float(lut[frame[hotspot[1], hotspot[0]]])
+            if radius < 0:
+                radius_temperature = output['radius temperature']
+            elif radius != 0:
+                radius_temperature = get_temperature_from_value(get_radius_mean(frame, hotspot, radius), thermal_file, temp_min, temp_max)
+            else:
+                radius_temperature = temperature
+            output['hotspots'].append({
+                'center pixel': hotspot,
+                'temperature': temperature,
+                'radius temperature': radius_temperature
+            })
+    if danger_value is not None:
+        output['danger pixels'] = danger_pixels
+        output['percentage'] = 100 * danger_pixels / frame.size
+    return output
+
+def main(args: list):
+    # Użycie: tiledParser.py plik [danger_temp] lub tiledParser.py plik.raw szerokość wysokość [danger_temp]
+    if len(args) < 1:
+        print('Error while parsing: Not enough parameters')
+        return
+    if not args[0].lower().endswith(_raw_extensions):
+        frame, rest = open_frame(args[0]), args[1:]
+    else:
+        if len(args) < 3:
+            print('Error while parsing: Raw frame requires width and height')
+            return
+        frame, rest = open_frame(args[0], (int(args[1]), int(args[2]))), args[3:]
+    print(find_hottest_pixel_tiled(frame, danger_temp = float(rest[0]) if rest else None))
+
+if __name__ == '__main__':
+    main(argv[1:])
@@ -0,0 +1,76 @@
+from communicator import get_parser_arguments, analyze_with_cache
+from concurrent.futures import ThreadPoolExecutor, Future
+from json import loads as from_json
+from os import cpu_count
+
+# Profile kamer w pliku JSON: obiekt, w którym kluczem jest identyfikator kamery, a wartością profil z tymi samymi kluczami
+# co w nagłówku daemona, np. {"brama": {"danger temp": 60, "work areas": [[[2, 58], [585, 456]]]}, "hala": {"temp max": 120}}.
+# Brakujące klucze brane są z constants.py
+
+class CameraProfile:
+    # Konfiguracja jednej kamery: argumenty parsera i plan analizy, liczone raz przy wczytaniu profili, a nie dla każdego obrazu
+    def __init__(self, camera_id: str, profile: dict):
+        # Parser (a z nim Pillow i numpy) importowany dopiero tutaj, tak jak w communicator.analyze_with_cache
+        from thermalImageParser import get_analysis_plan
+        self.camera_id = camera_id
+        self.profile = profile
+        self.arguments = get_parser_arguments(profile)
+        self.arguments['show_image'] = False
+        self.arguments['save_image'] = None
+        self.arguments['save_temperature_map'] = None
+        self.arguments['plan'] = get_analysis_plan(
+            self.arguments['image_size'],
+            self.arguments['palette_bounds'],
+            self.arguments['temp_min'],
+            self.arguments['temp_max'],
+            self.arguments['danger_temp'],
+            self.arguments['work_areas']
+        )
+
+    def analyze(self, image_bytes: bytes) -> dict:
+        try:
+            # analyze_with_cache zmienia argumenty, a profil jest wspólny dla wszystkich wątków
+            output = analyze_with_cache(image_bytes, self.arguments.copy())
+        except Exception as error:
+            output = {'error msg': '{}: {}'.format(type(error).__name__, error)}
+        output['camera'] = self.camera_id
+        return output
+
+def read_camera_profiles(filename: str) -> dict[str, dict]:
+    with open(filename, 'r') as file:
+        profiles = from_json(file.read())
+    if not isinstance(profiles, dict):
+        raise ValueError('Camera profiles file \"{}\" must contain an object with camera ids as keys'.format(filename))
+    return {str(camera_id): profile for camera_id, profile in profiles.items()}
+
+def load_camera_profiles(filename: str) -> dict[str, CameraProfile]:
+    return {camera_id: CameraProfile(camera_id, profile) for camera_id, profile in read_camera_profiles(filename).items()}
+
+class MultiCameraExecutor:
+    # Analiza obrazów z wielu kamer naraz w puli wątków. Dekodowanie w Pillow i operacje numpy na całych tablicach zwalniają GIL,
+    # więc wątki mogą pracować równolegle, a profile, plany i pamięć podręczna wyników są wspólne, bez kopiowania między procesami
+    def __init__(self, profiles: dict[str, CameraProfile], workers: int | None = None):
+        self.profiles = profiles
+        self.workers = workers or cpu_count()
+        self.pool = ThreadPoolExecutor(max_workers = self.workers, thread_name_prefix = 'camera')
+
+    def submit(self, camera_id: str, image_bytes: bytes) -> Future:
+        profile = self.profiles.get(camera_id)
+        if profile is None:
+            # Obraz z nieznanej kamery nie może przerwać przetwarzania pozostałych
+            future = Future()
+            future.set_result({'error msg': 'Unknown camera \"{}\"'.format(camera_id), 'camera': camera_id})
+            return future
+        return self.pool.submit(profile.analyze, image_bytes)
+
+    def analyze(self, camera_id: str, image_bytes: bytes) -> dict:
+        return self.submit(camera_id, image_bytes).result()
+
+    def close(self) -> None:
+        self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception) -> None:
+        self.close()
@@ -1,17 +1,50 @@
 import constants
 import utils
-from sys import stderr
-from thermalImageParser import main as find_danger_percentage
+from sys import stderr, stdin, stdout
 from os.path import isfile
-from requests import post as post_request
-from json import dumps as to_json
+from json import dumps as to_json, loads as from_json
+from collections import deque
+from resultCache import ResultCache, get_cache_key
+from instrumentation import StageTimer
 
-arg_flags = ['send', 'filename', 'save']
+arg_flags = ['send', 'filename', 'save', 'daemon', 'stdin', 'stream', 'batch', 'cameras']
 flags_shortened = {
     'S': 'send',
     'F': 'filename',
-    'V': 'save'
+    'V': 'save',
+    'D': 'daemon',
+    'I': 'stdin',
+    'M': 'stream',
+    'B': 'batch',
+    'C': 'cameras'
 }
+# Klucze profilu konfiguracji i odpowiadające im parametry find_danger_percentage
+profile_keys = {
+    'image size': 'image_size',
+    'palette bounds': 'palette_bounds',
+    'temp min': 'temp_min',
+    'temp max': 'temp_max',
+    'danger temp': 'danger_temp',
+    'work areas': 'work_areas',
+    'rounding': 'rounding',
+    'alert temps': 'alert_temps',
+    'area statistics': 'area_statistics',
+    'decode mode': 'decode_mode',
+    'fire regions': 'fire_regions',
+    'fire region min pixels': 'fire_region_min_pixels',
+    'radiometric': 'radiometric',
+    'native resolution': 'native_resolution',
+    'triage': 'triage'
+}
+# Parametry, które nie wpływają na wynik, tylko na to co dzieje się obok niego
+side_effect_arguments = ('show_image', 'print_result', 'save_image', 'save_temperature_map', 'timings', 'profile')
+# Parametry wyliczane z pozostałych, więc nie zmieniają odcisku konfiguracji
+derived_arguments = ('plan',)
+# Pola wyniku opisujące jedno wywołanie (czasy, etap triage, liczniki pamięci podręcznej, ponowne użycie wyniku klatki),
+# więc nie trafiają do pamięci podręcznej
+per_call_output_keys = ('stage timings', 'triage', 'cache', 'reused')
+_result_cache = None
+_analyzed_frames = 0
 
 def get_filepath_from_args(args: list) -> dict:
     ret = {
@@ -53,9 +86,291 @@ def save_output_as_file(output: dict, filename: str) -> None:
     file.close()
 
 def send_output_with_request(output: dict, endpoint_url: str, api_key: str) -> None:
+    from requests import post as post_request
     data = output.copy()
     data['api key'] = api_key
-    post_request(url = endpoint_url, data = data) # Można ewentualnie sprawdzić czy poprawnie się wysłało
+    post_request(url = endpoint_url, data = data, timeout = constants.SEND_TIMEOUT) # Można ewentualnie sprawdzić czy poprawnie się wysłało
+
+def get_parser_arguments(profile: dict | None = None) -> dict:
+    arguments = {
+        'image_size': constants.IMAGE_SIZE,
+        'palette_bounds': constants.PALETTE_BOUNDS,
+        'temp_min': constants.TEMP_MIN,
+        'temp_max': constants.TEMP_MAX,
+        'danger_temp': constants.DANGER_TEMP,
+        'work_areas': constants.WORK_AREAS,
+        'show_image': constants.SHOW_IMAGES,
+        'print_result': False,
+        'save_image': constants.SAVE_IMAGES,
+        'rounding': constants.ROUNDING,
+        'save_temperature_map': constants.SAVE_TEMPERATURE_MAP,
+        'alert_temps': constants.ALERT_TEMPS,
+        'area_statistics': constants.AREA_STATISTICS,
+        'decode_mode': constants.DECODE_MODE,
+        'fire_regions': constants.FIRE_REGIONS,
+        'fire_region_min_pixels': constants.FIRE_REGION_MIN_PIXELS,
+        'radiometric': constants.RADIOMETRIC,
+        'native_resolution': constants.NATIVE_RESOLUTION,
+        'triage': constants.TRIAGE,
+        'timings': constants.TIMINGS or constants.METRICS_FILE is not None,
+        'profile': False
+    }
+    if profile is None:
+        return arguments
+    for key, value in profile.items():
+        if key not in profile_keys:
+            raise KeyError('Unrecognized profile key \"{}\"'.format(key))
+        arguments[profile_keys[key]] = value
+    return arguments
+
+def get_result_cache() -> ResultCache | None:
+    global _result_cache
+    if not constants.RESULT_CACHE:
+        return None
+    if _result_cache is None:
+        _result_cache = ResultCache(constants.RESULT_CACHE_ENTRIES, constants.RESULT_CACHE_BYTES, constants.RESULT_CACHE_DIRECTORY)
+    return _result_cache
+
+def get_configuration_fingerprint(arguments: dict) -> str:
+    return to_json({key: value for key, value in arguments.items() if key not in side_effect_arguments and key not in derived_arguments}, sort_keys = True)
+
+def is_profiled_frame() -> bool:
+    # Co PROFILE_EVERY analizowany obraz (liczony osobno w każdym procesie) jest profilowany
+    global _analyzed_frames
+    _analyzed_frames += 1
+    return constants.PROFILE_EVERY > 0 and _analyzed_frames % constants.PROFILE_EVERY == 0
+
+def prepare_analysis(image_bytes: bytes, arguments: dict, decode: bool = False) -> dict:
+    # Pierwsza część analyze_with_cache: sprawdzenie pamięci podręcznej i (przy decode) zdekodowanie obrazu, druga to finish_analysis.
+    # W potoku --stream obie części wykonywane są w osobnych wątkach.
+    # Wynik dla identycznych bajtów i konfiguracji brany jest z pamięci podręcznej, o ile analiza nie ma pokazać lub zapisać obrazu
+    # ani nie jest profilowana
+    arguments['profile'] = arguments['profile'] or is_profiled_frame()
+    task = {
+        'image bytes': image_bytes,
+        'arguments': arguments,
+        'timer': StageTimer(arguments['timings']),
+        'key': None,
+        'output': None
+    }
+    shows_image = arguments['show_image'] or arguments['save_image'] != None
+    cache = get_result_cache()
+    if cache is not None and not (shows_image or arguments['save_temperature_map'] != None or arguments['profile']):
+        with task['timer'].stage('cache lookup'):
+            task['key'] = get_cache_key(image_bytes, get_configuration_fingerprint(arguments))
+            task['output'] = cache.get(task['key'])
+        if task['output'] is not None:
+            return task
+    # Profilowany obraz dekodowany jest dopiero w parserze, żeby profil obejmował też dekodowanie
+    if decode and not (shows_image or arguments['profile']):
+        # Parser (a z nim Pillow i numpy) importowany dopiero tutaj, bo wynik z pamięci podręcznej na dysku go nie potrzebuje
+        from thermalImageParser import decode_image, get_analysis_plan
+        plan = arguments.get('plan') or get_analysis_plan(arguments['image_size'], arguments['palette_bounds'], arguments['temp_min'], arguments['temp_max'], arguments['danger_temp'], arguments['work_areas'])
+        arguments['decoded'] = decode_image(image_bytes, plan, False, arguments['decode_mode'], arguments['radiometric'], task['timer'], not arguments['native_resolution'])
+    return task
+
+def finish_analysis(task: dict, analyzer = None) -> dict:
+    # Przy analyzer (SequenceAnalyzer) obraz nieznaleziony w pamięci podręcznej analizowany jest przez niego
+    from thermalImageParser import main as find_danger_percentage
+    output = task['output']
+    hit = output is not None
+    if not hit and analyzer is not None:
+        output = analyzer.analyze(task['image bytes'], task['arguments'])
+    elif not hit:
+        output = find_danger_percentage(task['image bytes'], **task['arguments'])
+        # Wynik użyty ponownie dla innej klatki (przy INCREMENTAL_TOLERANCE może być przybliżony) nie trafia do pamięci podręcznej
+        if task['key'] is not None and not output.get('reused'):
+            get_result_cache().put(task['key'], {name: value for name, value in output.items() if name not in per_call_output_keys})
+    if task['arguments']['timings']:
+        output.setdefault('stage timings', {}).update(task['timer'].get_timings())
+    if task['key'] is not None:
+        output['cache'] = {'hit': hit}
+        output['cache'].update(get_result_cache().get_counters())
+    return output
+
+def analyze_with_cache(image_bytes: bytes, arguments: dict) -> dict:
+    return finish_analysis(prepare_analysis(image_bytes, arguments))
+
+def get_frame_arguments(profile: dict | None = None) -> dict:
+    arguments = get_parser_arguments(profile)
+    arguments['show_image'] = False
+    arguments['save_image'] = None
+    arguments['save_temperature_map'] = None
+    return arguments
+
+def get_error_output(error: Exception) -> dict:
+    return {'error msg': '{}: {}'.format(type(error).__name__, error)}
+
+def analyze_frame(image_bytes: bytes, profile: dict | None = None) -> dict:
+    try:
+        return analyze_with_cache(image_bytes, get_frame_arguments(profile))
+    except Exception as error:
+        # Zepsuty obraz lub profil nie może przerwać przetwarzania kolejnych obrazów
+        return get_error_output(error)
+
+def decode_frame(image_bytes: bytes) -> dict:
+    # Etap dekodowania potoku --stream. Błąd przekazywany jest dalej jako gotowy wynik
+    try:
+        return prepare_analysis(image_bytes, get_frame_arguments(), True)
+    except Exception as error:
+        return {'output': get_error_output(error)}
+
+def analyze_decoded_frame(task: dict, analyzer = None) -> dict:
+    # Etap analizy potoku --stream
+    if 'arguments' not in task:
+        return task['output']
+    try:
+        return finish_analysis(task, analyzer)
+    except Exception as error:
+        return get_error_output(error)
+
+def get_result_sender():
+    from resultDelivery import ResultSender
+    return ResultSender(constants.ENDPOINT_URL, constants.API_KEY, constants.SEND_BATCH_SIZE, constants.SEND_BATCH_DELAY, constants.SEND_TIMEOUT, constants.SEND_RETRIES)
+
+def get_result_outbox(background: bool, timeout: float | None = None, wait_for_lock: bool = True):
+    from resultOutbox import ResultOutbox
+    timeout = constants.SEND_TIMEOUT if timeout is None else timeout
+    return ResultOutbox(constants.OUTBOX_DIRECTORY, constants.ENDPOINT_URL, constants.API_KEY, constants.OUTBOX_SEGMENT_BYTES, constants.OUTBOX_MAX_BYTES, constants.OUTBOX_FSYNC_INTERVAL, constants.SEND_BATCH_SIZE, timeout, background = background, wait_for_lock = wait_for_lock)
+
+def send_output_through_outbox(output: dict) -> None:
+    # Wynik tylko trafia na dysk (z fsync przy zamknięciu), po czym blokada folderu jest od razu zwalniana.
+    # Potem jedna próba wysłania jednej paczki czekających wyników, najwyżej OUTBOX_SEND_TIMEOUT sekund. Jeśli folder
+    # zajmuje inny proces (np. --stream, który wysyła w tle), wysyłanie zostaje jemu, a reszta czeka na kolejne uruchomienia
+    outbox = get_result_outbox(False)
+    try:
+        if not outbox.append(output, constants.OUTBOX_WAIT):
+            print('Error:\n\tOutbox is full, result dropped', file = stderr)
+    finally:
+        outbox.close()
+    try:
+        outbox = get_result_outbox(False, constants.OUTBOX_SEND_TIMEOUT, False)
+    except BlockingIOError:
+        return
+    try:
+        outbox.drain(1)
+    finally:
+        outbox.close()
+
+def get_sequence_analyzer():
+    from sequenceAnalyzer import SequenceAnalyzer
+    from thermalImageParser import get_analysis_plan
+    arguments = get_parser_arguments()
+    plan = get_analysis_plan(arguments['image_size'], arguments['palette_bounds'], arguments['temp_min'], arguments['temp_max'], arguments['danger_temp'], arguments['work_areas'])
+    return SequenceAnalyzer(plan, tolerance = constants.INCREMENTAL_TOLERANCE, full_recompute_interval = constants.INCREMENTAL_FULL_RECOMPUTE)
+
+def analyze_sequence_frame(analyzer, image_bytes: bytes) -> dict:
+    try:
+        return finish_analysis(prepare_analysis(image_bytes, get_frame_arguments(), True), analyzer)
+    except Exception as error:
+        return get_error_output(error)
+
+def get_camera_executor():
+    from cameraProfiles import MultiCameraExecutor, load_camera_profiles
+    if constants.CAMERA_PROFILES is None:
+        raise ValueError('CAMERA_PROFILES is not set in constants.py')
+    return MultiCameraExecutor(load_camera_profiles(constants.CAMERA_PROFILES), constants.CAMERA_WORKERS)
+
+def submit_camera_frame(executor, header: bytes, image_bytes: bytes):
+    from concurrent.futures import Future
+    try:
+        camera_id = from_json(header).get('camera') if header else None
+    except (ValueError, AttributeError) as error:
+        future = Future()
+        future.set_result({'error msg': 'Invalid frame header: {}'.format(error)})
+        return future
+    return executor.submit(camera_id, image_bytes)
+
+def handle_stream_output(output: dict, sender, outbox) -> None:
+    stdout.write(to_json(output) + '\n')
+    stdout.flush()
+    if sender is not None and 'error msg' not in output:
+        sender.send(output)
+    if outbox is not None and 'error msg' not in output:
+        outbox.append(output, constants.OUTBOX_WAIT)
+
+def read_stream_frames():
+    while True:
+        try:
+            image_bytes = utils.read_frame(stdin.buffer, constants.MAX_FRAME_BYTES)
+        except (EOFError, utils.FrameTooLargeError) as error:
+            print('Error:\n\t{}'.format(error), file = stderr)
+            return
+        if image_bytes is None:
+            return
+        yield image_bytes
+
+def process_stream_pipeline(sender, outbox, analyzer = None) -> None:
+    # Czytanie, dekodowanie, analiza i wypisanie (wysłanie) kolejnych obrazów działają jednocześnie, połączone kolejkami
+    # o długości PIPELINE_QUEUE_SIZE. Na koniec na standardowe wyjście błędów wypisywane jest obciążenie każdego etapu.
+    # Przy analyzer (INCREMENTAL) etap analizy korzysta z niego
+    from framePipeline import FramePipeline, PipelineStage
+    from instrumentation import StageMetrics
+    metrics = StageMetrics() if constants.METRICS_FILE is not None else None
+    def deliver(output: dict) -> None:
+        handle_stream_output(output, sender, outbox)
+        if metrics is not None:
+            metrics.observe(output)
+            metrics.write_if_due(constants.METRICS_FILE, constants.METRICS_INTERVAL)
+    pipeline = FramePipeline([
+        PipelineStage('decode', decode_frame, constants.PIPELINE_DECODE_WORKERS, constants.PIPELINE_QUEUE_SIZE),
+        PipelineStage('analysis', lambda task: analyze_decoded_frame(task, analyzer), constants.PIPELINE_ANALYSIS_WORKERS, constants.PIPELINE_QUEUE_SIZE),
+        PipelineStage('delivery', deliver, 1, constants.PIPELINE_QUEUE_SIZE)
+    ])
+    if metrics is not None:
+        metrics.collectors.append(pipeline.get_metric_lines)
+    try:
+        pipeline.run(read_stream_frames())
+    finally:
+        if metrics is not None:
+            metrics.write(constants.METRICS_FILE)
+        for name, counters in pipeline.get_counters().items():
+            print('Stage {}: {items} items, {workers} workers, {utilization:.0%} busy, queue depth {mean queue depth:.1f} mean / {max queue depth} max, {blocked seconds:.3f} s blocked'.format(name, **counters), file = stderr)
+
+def process_stream(send: bool, cameras: bool = False) -> None:
+    # Obrazy jako ramki (4 bajty długości big endian + dane) na stdin, jeden wynik JSON na linię na stdout.
+    # Przy INCREMENTAL klatki traktowane są jako sekwencja z jednej kamery, a klatka bez zmian w obszarach roboczych
+    # dostaje wynik poprzedniej
+    # Przy cameras każdy obraz poprzedza ramka z nagłówkiem JSON {"camera": "id"}, obrazy z wielu kamer analizowane są naraz
+    # w puli wątków według profili z CAMERA_PROFILES, a wyniki wypisywane są w kolejności obrazów
+    # Wyniki wysyłane są w tle, w paczkach, więc analiza nie czeka na serwer. Przy OUTBOX_DIRECTORY wysyłane są z dysku
+    analyzer = get_sequence_analyzer() if constants.INCREMENTAL and not cameras else None
+    executor = get_camera_executor() if cameras else None
+    sender = get_result_sender() if send and constants.OUTBOX_DIRECTORY is None else None
+    outbox = get_result_outbox(True) if send and constants.OUTBOX_DIRECTORY is not None else None
+    pending = deque()
+    try:
+        if constants.PIPELINE and executor is None:
+            process_stream_pipeline(sender, outbox, analyzer)
+            return
+        while True:
+            try:
+                header = utils.read_frame(stdin.buffer, constants.MAX_FRAME_BYTES) if executor is not None else b''
+                image_bytes = utils.read_frame(stdin.buffer, constants.MAX_FRAME_BYTES) if header is not None else None
+            except (EOFError, utils.FrameTooLargeError) as error:
+                print('Error:\n\t{}'.format(error), file = stderr)
+                return
+            if image_bytes is None:
+                return
+            if executor is not None:
+                # Najwyżej dwa obrazy na wątek czekają w pamięci, a gotowe wyniki wypisywane są od razu
+                pending.append(submit_camera_frame(executor, header, image_bytes))
+                while pending and (pending[0].done() or len(pending) > 2 * executor.workers):
+                    handle_stream_output(pending.popleft().result(), sender, outbox)
+                continue
+            output = analyze_frame(image_bytes) if analyzer is None else analyze_sequence_frame(analyzer, image_bytes)
+            handle_stream_output(output, sender, outbox)
+    finally:
+        while pending:
+            handle_stream_output(pending.popleft().result(), sender, outbox)
+        if executor is not None:
+            executor.close()
+        if sender is not None:
+            sender.close()
+            print('Sent {sent} results in {batches} batches ({failed} failed, {dropped} dropped)'.format(**sender.get_counters()), file = stderr)
+        if outbox is not None:
+            outbox.close(constants.SEND_TIMEOUT)
+            print('Sent {sent} results from outbox ({rejected} rejected, {pending bytes} bytes still on disk)'.format(**outbox.get_counters()), file = stderr)
 
 def main():
     args, errs, flags = utils.parse_argv(arg_flags, flags_shortened)
@@ -63,33 +378,51 @@ def main():
         print('Error:\n\tUnrecognized flag \"{}\"'.format(err), file = stderr)
     if len(errs) > 0:
         return 
-    # Pobranie danych na dwa sposoby, zależy od potrzeb
-    if flags['filename']:
-        input_data = get_filepath_from_args(args)
-    else:
-        input_data = get_filepath_from_input()
-    if not input_data['ok']:
-        print('Error:\n\t{}'.format(input_data['error msg']), file = stderr)
+    if flags['daemon']:
+        import parserDaemon
+        camera_profiles = None
+        if constants.CAMERA_PROFILES is not None:
+            from cameraProfiles import read_camera_profiles
+            camera_profiles = read_camera_profiles(constants.CAMERA_PROFILES)
+        parserDaemon.run_daemon(constants.DAEMON_ADDRESS, constants.DAEMON_SOCKET, constants.DAEMON_WORKERS, constants.METRICS_FILE, constants.METRICS_INTERVAL, camera_profiles, constants.MAX_FRAME_BYTES)
+        return
+    if flags['batch']:
+        if len(args) < 1:
+            print('Error:\n\tNo directory or pattern provided', file = stderr)
+            return
+        import parserBatch
+        summary = parserBatch.run_batch(args[0], args[1] if len(args) > 1 else None, constants.BATCH_WORKERS, constants.METRICS_FILE, constants.METRICS_INTERVAL)
+        print('Processed {processed} of {total} files ({skipped} skipped, {errors} errors)'.format(**summary), file = stderr)
         return
-    output = find_danger_percentage(
-        filename = input_data['filepath'],
-        image_size = constants.IMAGE_SIZE,
-        palette_bounds = constants.PALETTE_BOUNDS,
-        temp_min = constants.TEMP_MIN,
-        temp_max = constants.TEMP_MAX,
-        danger_temp = constants.DANGER_TEMP,
-        work_areas = constants.WORK_AREAS,
-        show_image = constants.SHOW_IMAGES,
-        print_result = False,
-        save_image = constants.SAVE_IMAGES,
-        rounding = constants.ROUNDING
-    )
+    if flags['stream'] or flags['cameras']:
+        process_stream(flags['send'], flags['cameras'])
+        return
+    # Pobranie danych na trzy sposoby, zależy od potrzeb
+    if flags['stdin']:
+        output = analyze_frame(stdin.buffer.read())
+        if 'error msg' in output:
+            print('Error:\n\t{}'.format(output['error msg']), file = stderr)
+            return
+    else:
+        if flags['filename']:
+            input_data = get_filepath_from_args(args)
+        else:
+            input_data = get_filepath_from_input()
+        if not input_data['ok']:
+            print('Error:\n\t{}'.format(input_data['error msg']), file = stderr)
+            return
+        with open(input_data['filepath'], 'rb') as file:
+            output = analyze_with_cache(file.read(), get_parser_arguments())
     # Wysłanie danych na dwa sposoby, zależnie od potrzeb
-    if flags['send']:
+    if flags['send'] and constants.OUTBOX_DIRECTORY is not None:
+        send_output_through_outbox(output)
+    elif flags['send']:
         send_output_with_request(output, constants.ENDPOINT_URL, constants.API_KEY)
     if flags['save']:
         save_output_as_file(output, constants.OUTPUT_SAVE_FILE)
-    if not (flags['send'] or flags['save']):
+    if flags['stdin'] and not flags['save']:
+        print(to_json(output))
+    elif not (flags['send'] or flags['save']):
         print(output)
 
 if __name__ == '__main__':
@@ -21,4 +21,45 @@ WORK_AREAS = [
 OUTPUT_SAVE_FILE = 'output.json'
 ROUNDING = -1 #What decimal place to round the result to. Negative number means no rounding at all
 SHOW_IMAGES = False #If set to true, program will show where danger pixels are. For testing purposes only
-SAVE_IMAGES = None #If given path instead of None, it will create or overwrite an image as above, instead of showing it. For testing purposes only
\ No newline at end of file
+SAVE_IMAGES = None #If given path instead of None, it will create or overwrite an image as above, instead of showing it. For testing purposes only
+DAEMON_ADDRESS = ('127.0.0.1', 5050) #Host and port the parser daemon (communicator.py --daemon) listens on
+DAEMON_SOCKET = None #If given path instead of None, daemon listens on a Unix socket instead of DAEMON_ADDRESS
+DAEMON_WORKERS = None #How many worker processes daemon uses. None means one per CPU core
+MAX_FRAME_BYTES = 64 * 1024 * 1024 #Largest frame (header or image) daemon and --stream mode accept. Longer frames get an error reply and end the connection
+BATCH_WORKERS = None #How many worker processes batch mode (communicator.py --batch) uses. None means one per CPU core
+CAMERA_PROFILES = None #If given path instead of None, JSON file with configuration profiles of many cameras, used by --cameras mode and by daemon requests with "camera" in the header
+CAMERA_WORKERS = None #How many threads --cameras mode uses. None means one per CPU core
+SAVE_TEMPERATURE_MAP = None #If given path instead of None, per-pixel temperature map (float32) is saved there as .npy file
+ALERT_TEMPS = None #List of temperatures, e.g. [35., 40., 55.], for which percentage of hot pixels is reported in 'alert levels' along with a histogram. None means only DANGER_TEMP is used
+AREA_STATISTICS = False #If set to true, output also contains pixel count, danger percentage and hottest, mean and 95th percentile temperature of every work area
+DECODE_MODE = 'fast' #How images are decoded: 'full' (always RGB and resize), 'fast' (same result for images of IMAGE_SIZE, faster downscaling of big JPEGs) or 'luma' (grayscale only JPEG decoding, fastest but less accurate)
+FIRE_REGIONS = False #If set to true, output also lists separate regions of hot pixels in work areas with their size, bounding box, centroid and hottest temperature
+FIRE_REGION_MIN_PIXELS = 1 #Regions smaller than this many pixels are not listed
+RADIOMETRIC = False #If set to true, temperatures are calculated from raw sensor data embedded in FLIR camera JPEGs when present instead of from the palette colors. Changes results of such images and adds 'radiometric' to output, so it is off by default
+NATIVE_RESOLUTION = False #If set to true, images are analyzed in their decoded resolution with WORK_AREAS and PALETTE_BOUNDS rescaled to it, instead of resizing every image to IMAGE_SIZE. Coordinates in output are still given for IMAGE_SIZE
+TRIAGE = False #If set to true, counting of hot pixels (and FIRE_REGIONS) is skipped when the brightest pixel of work areas is already below DANGER_TEMP. Results are the same, output also contains 'triage' with the tier that answered and the escalation rate. Not used with ALERT_TEMPS, AREA_STATISTICS, images or temperature maps
+INCREMENTAL = False #If set to true, frames in --stream mode are treated as a sequence from one camera and a frame whose work areas did not change gets the result of the last analyzed frame
+INCREMENTAL_TOLERANCE = 0 #By how many gray levels work area pixels may differ from the last analyzed frame for its result to be reused. 0 gives exactly the same results as full analysis
+INCREMENTAL_FULL_RECOMPUTE = 30 #After how many reused results in a row a frame is analyzed again regardless of changes
+PIPELINE = True #If set to true, --stream mode reads, decodes, analyzes and outputs consecutive frames at the same time in separate threads
+PIPELINE_QUEUE_SIZE = 4 #How many frames may wait before each pipeline stage. A full queue pauses the previous stage
+PIPELINE_DECODE_WORKERS = 1 #How many threads decode frames in the pipeline
+PIPELINE_ANALYSIS_WORKERS = 1 #How many threads analyze decoded frames in the pipeline
+RESULT_CACHE = False #If set to true, results for identical image bytes and settings are reused instead of analyzing the image again
+RESULT_CACHE_ENTRIES = 256 #How many results are kept in memory
+RESULT_CACHE_BYTES = 16 * 1024 * 1024 #How many bytes of results are kept in memory
+RESULT_CACHE_DIRECTORY = None #If given path instead of None, results are also kept in this folder and shared between runs and processes
+SEND_TIMEOUT = 10. #How many seconds to wait for the endpoint before giving up on a request
+SEND_BATCH_SIZE = 16 #How many results --stream mode sends to the endpoint in one request
+SEND_BATCH_DELAY = 0.5 #How many seconds --stream mode waits for more results before sending an incomplete batch
+SEND_RETRIES = 3 #How many times to retry sending a batch after a network or server error
+OUTBOX_DIRECTORY = None #If given path instead of None, --send first writes results to this folder and sends them from there, so results are kept on disk while the endpoint is unreachable
+OUTBOX_MAX_BYTES = 64 * 1024 * 1024 #How many bytes of unsent results the outbox may keep on disk
+OUTBOX_SEGMENT_BYTES = 1024 * 1024 #Size of a single outbox file after which a new one is started
+OUTBOX_FSYNC_INTERVAL = 0.2 #How many seconds may pass between flushing outbox writes to disk
+OUTBOX_WAIT = 0. #How many seconds to wait for free space when the outbox is full before dropping the result
+OUTBOX_SEND_TIMEOUT = 2. #How many seconds a single image run with --send waits for the endpoint when sending from the outbox. Results that were not sent stay on disk
+TIMINGS = False #If set to true, output contains wall and CPU time of each analysis stage
+PROFILE_EVERY = 0 #If above 0, every n-th analyzed image is profiled and output contains the slowest functions and peak memory usage
+METRICS_FILE = None #If given path instead of None, --daemon and --batch modes write aggregated stage timings to this file in Prometheus text format
+METRICS_INTERVAL = 10. #How many seconds may pass between updates of METRICS_FILE
\ No newline at end of file
@@ -1,10 +1,11 @@
 from PIL import Image
-from numpy import asarray, uint16
+from numpy import asarray, uint16, int32, int64, float32, float64, ndarray, arange, count_nonzero
 from sys import argv
 from os.path import isfile
-from cv2 import imread as image_read, IMREAD_ANYDEPTH
+from temperatures import get_palette_lut, get_radiometric_lut, get_temperature_map
 
 default_range = (20., 40.)
+default_hotspot_distance = 10
   
 def main(args: list):
     parsed_args = parse_args(args)
@@ -94,37 +95,74 @@ def get_temperature_from_value(value: int | float, thermal_file = True, temp_min
         return value/100 - 273.15 #Możliwe że trzeba poprawić wzór - zależnie od kamery
     return (temp_max - temp_min) * value / 255 + temp_min
   
-def find_hottest_pixel(image_fp: str, thermal_file = True, temp_min = 0, temp_max = 0, radius = 0):
-    # Inicjalizacja zmiennych
+def get_temperature_lut(thermal_file = True, temp_min = 0, temp_max = 0, dtype: type = float64) -> ndarray:
+    # Tablica dla wszystkich możliwych wartości pikseli, daje te same wyniki co get_temperature_from_value
     if thermal_file:
-        image_array = uint16(image_read(image_fp, IMREAD_ANYDEPTH))
-    else:
-        image = Image.open(image_fp)
-        image_array = asarray(image.convert('L'))
-    hottest = 0
-    center_pixel = (0, 0)
-    sum_of_heats = 0
-    pixels_in_radius = 0
+        return get_radiometric_lut(dtype)
+    return get_palette_lut((0, 255), (temp_min, temp_max), dtype)
+
+def get_image_array(image_fp: str, thermal_file = True) -> ndarray:
+    if thermal_file:
+        # OpenCV potrzebne tylko do 16-bitowych plików radiometrycznych, a jego import trwa długo
+        from cv2 import imread as image_read, IMREAD_ANYDEPTH
+        return uint16(image_read(image_fp, IMREAD_ANYDEPTH))
+    image = Image.open(image_fp)
+    return asarray(image.convert('L'))
+
+def get_radius_mean(image_array: ndarray, center_pixel: tuple[int, int], radius: int) -> float:
+    # Średnia wartość pikseli w kole o środku center_pixel, liczona tylko w kwadracie otaczającym koło.
+    # Ujemny promień oznacza cały obraz
+    if radius < 0:
+        return int(image_array.sum(dtype = int64)) / image_array.size
+    x, y = center_pixel
+    top, bottom = max(y - radius, 0), min(y + radius + 1, image_array.shape[0])
+    left, right = max(x - radius, 0), min(x + radius + 1, image_array.shape[1])
+    offsets_y = arange(top, bottom)[:, None] - y
+    offsets_x = arange(left, right)[None, :] - x
+    disk = offsets_x**2 + offsets_y**2 <= radius**2
+    return int(image_array[top:bottom, left:right].sum(where = disk, dtype = int64)) / int(count_nonzero(disk))
+
+def find_hotspots(image_array: ndarray, count: int, distance: int = default_hotspot_distance) -> list[tuple[int, int]]:
+    # Kolejne najcieplejsze piksele, przy czym po znalezieniu piksela jego otoczenie w odległości distance jest pomijane (non-maximum suppression)
+    candidates = image_array.astype(int32)
+    hotspots = []
+    for _ in range(count):
+        index = int(candidates.argmax())
+        y, x = divmod(index, candidates.shape[1])
+        if candidates[y, x] < 0:
+            break
+        hotspots.append((x, y))
+        top, bottom = max(y - distance, 0), min(y + distance + 1, candidates.shape[0])
+        left, right = max(x - distance, 0), min(x + distance + 1, candidates.shape[1])
+        offsets_y = arange(top, bottom)[:, None] - y
+        offsets_x = arange(left, right)[None, :] - x
+        candidates[top:bottom, left:right][offsets_x**2 + offsets_y**2 <= distance**2] = -1
+    return hotspots
+
+def find_hottest_pixel(image_fp: str, thermal_file = True, temp_min = 0, temp_max = 0, radius = 0, return_temperature_map = False, hotspot_count = 0, hotspot_distance = default_hotspot_distance):
+    image_array = get_image_array(image_fp, thermal_file)
+    lut = get_temperature_lut(thermal_file, temp_min, temp_max)
     output = {}
-    # Znalezienie najcieplejszego / najjaśniejszego piksela
-    for y in range(len(image_array)):
-        for x in range(len(image_array[y])):
-            pixel = image_array[y][x]
-            if pixel > hottest:
-                hottest = pixel
-                center_pixel = (x, y)
-    output['temperature'] = get_temperature_from_value(hottest, thermal_file, temp_min, temp_max)
+    # Znalezienie najcieplejszego / najjaśniejszego piksela (pierwszego, jeśli jest kilka takich samych)
+    y, x = divmod(int(image_array.argmax()), image_array.shape[1])
+    center_pixel = (x, y)
+    output['temperature'] = float(lut[image_array[y, x]])
     output['center pixel'] = center_pixel
     output['radius temperature'] = output['temperature']
-    # Znalezienie sąsiednich pikseli w promieniu najcieplejszego piksela
+    # Średnia temperatura pikseli w promieniu najcieplejszego piksela
     if radius != 0:
-        for y in range(len(image_array)):
-            for x in range(len(image_array[y])):
-                if radius < 0 or (x - center_pixel[0])**2 + (y - center_pixel[1])**2 <= radius**2:
-                    sum_of_heats += image_array[y][x]
-                    pixels_in_radius += 1
-        if pixels_in_radius > 0:
-            output['radius temperature'] = get_temperature_from_value(sum_of_heats / pixels_in_radius, thermal_file, temp_min, temp_max)
+        output['radius temperature'] = get_temperature_from_value(get_radius_mean(image_array, center_pixel, radius), thermal_file, temp_min, temp_max)
+    # Kilka różnych gorących punktów, oddalonych od siebie o więcej niż hotspot_distance
+    if hotspot_count > 0:
+        output['hotspots'] = []
+        for hotspot in find_hotspots(image_array, hotspot_count, hotspot_distance):
+            output['hotspots'].append({
+                'center pixel': hotspot,
+                'temperature': float(lut[image_array[hotspot[1], hotspot[0]]]),
+                'radius temperature': get_temperature_from_value(get_radius_mean(image_array, hotspot, radius), thermal_file, temp_min, temp_max) if radius != 0 else float(lut[image_array[hotspot[1], hotspot[0]]])
+            })
+    if return_temperature_map:
+        output['temperature map'] = get_temperature_map(image_array, get_temperature_lut(thermal_file, temp_min, temp_max, float32))
     return output
 
 if __name__ == '__main__':
@@ -0,0 +1,258 @@
+import utils
+from thermalImageParser import main as find_danger_percentage, get_image, get_analysis_plan, get_start_palette, count_danger_pixels, paint_danger_area
+from numpy import uint8, float32, arange, linspace, clip, repeat, percentile
+from numpy.random import default_rng
+from PIL import Image
+from io import BytesIO
+from json import dumps as to_json, loads as from_json
+from os import listdir
+from os.path import dirname, join, isdir, abspath
+from sys import stderr, stdout, executable, exit, version as python_version
+from platform import platform
+from subprocess import run as run_process, DEVNULL, PIPE
+from time import perf_counter
+from tracemalloc import start as start_tracing, stop as stop_tracing, get_traced_memory, reset_peak
+import numpy
+import PIL
+
+arg_flags = ['compare', 'quick', 'startup']
+flags_shortened = {
+    'C': 'compare',
+    'Q': 'quick',
+    'S': 'startup'
+}
+# Rozmiary sztucznych klatek: jak z kamery, dwa razy większe i 4K
+synthetic_sizes = {
+    '640x480': (640, 480),
+    '1280x960': (1280, 960),
+    '4k': (3840, 2160)
+}
+example_images_directory = join(dirname(abspath(__file__)), 'ExampleImages')
+_default_min_time = 1.
+_default_min_repeats = 5
+_default_max_repeats = 200
+_quick_min_time = 0.2
+_quick_min_repeats = 2
+_default_threshold = 1.1
+_subprocess_repeats = 5
+# Docelowy czas od uruchomienia "communicator.py --stdin" do wyniku (mediana), sprawdzany z flagą --startup
+_default_startup_budget = 0.5
+_slowest_imports_count = 10
+
+def get_synthetic_frame(size: tuple[int, int], seed: int = 0) -> bytes:
+    # Obraz podobny do zdjęć z kamery: szum i kilka gorących plam, a po prawej skala od jasnego (góra) do ciemnego (dół),
+    # w tym samym miejscu co w obrazach 640x480 po przeskalowaniu. Zwracany jako JPEG w pamięci
+    width, height = size
+    rng = default_rng(seed)
+    image = rng.normal(70, 12, (height, width)).astype(float32)
+    y, x = arange(height, dtype = float32)[:, None], arange(width, dtype = float32)[None, :]
+    for _ in range(6):
+        center_x, center_y = rng.uniform(0.05, 0.9) * width, rng.uniform(0.1, 0.9) * height
+        radius = rng.uniform(0.02, 0.08) * width
+        image += rng.uniform(80, 180) * numpy.exp(-((x - center_x)**2 + (y - center_y)**2) / (2 * radius**2))
+    scale_left, scale_right = round(620 * width / 640), round(636 * width / 640)
+    scale_top, scale_bottom = round(30 * height / 480), round(425 * height / 480)
+    image[scale_top:scale_bottom, scale_left:scale_right] = linspace(255, 0, scale_bottom - scale_top)[:, None]
+    gray = uint8(clip(image, 0, 255))
+    output = BytesIO()
+    Image.fromarray(repeat(gray[:, :, None], 3, axis = 2), mode = 'RGB').save(output, format = 'JPEG', quality = 90)
+    return output.getvalue()
+
+def get_frames(quick: bool = False) -> dict[str, bytes]:
+    frames = {}
+    if isdir(example_images_directory):
+        for name in sorted(listdir(example_images_directory)):
+            if name.lower().endswith(('.jpg', '.jpeg', '.png')):
+                with open(join(example_images_directory, name), 'rb') as file:
+                    frames[name] = file.read()
+                if quick:
+                    break
+    for name, size in synthetic_sizes.items():
+        frames['synthetic {}'.format(name)] = get_synthetic_frame(size)
+    return frames
+
+def get_percentile(values: list[float], q: float) -> float:
+    return float(percentile(values, q))
+
+def get_latency_summary(latencies: list[float], peak_memory: int | None) -> dict:
+    total = sum(latencies)
+    return {
+        'repeats': len(latencies),
+        'throughput': len(latencies) / total,
+        'mean ms': 1000 * total / len(latencies),
+        'min ms': 1000 * min(latencies),
+        'p50 ms': 1000 * get_percentile(latencies, 50),
+        'p90 ms': 1000 * get_percentile(latencies, 90),
+        'p99 ms': 1000 * get_percentile(latencies, 99),
+        'max ms': 1000 * max(latencies),
+        'peak memory bytes': peak_memory
+    }
+
+def measure(function, min_time: float, min_repeats: int, max_repeats: int = _default_max_repeats) -> dict:
+    # Jedno uruchomienie na rozgrzewkę, potem powtórzenia aż minie min_time sekund (i co najmniej min_repeats razy).
+    # Pamięć mierzona osobno, bo tracemalloc spowalnia działanie. Śledzi alokacje numpy i pythona, ale nie wewnętrzne bufory Pillow
+    function()
+    latencies = []
+    start = perf_counter()
+    while len(latencies) < max_repeats and (len(latencies) < min_repeats or perf_counter() - start < min_time):
+        call_start = perf_counter()
+        function()
+        latencies.append(perf_counter() - call_start)
+    start_tracing()
+    reset_peak()
+    function()
+    peak = get_traced_memory()[1]
+    stop_tracing()
+    return get_latency_summary(latencies, peak)
+
+def get_stage_cases(image_bytes: bytes) -> dict:
+    # Poszczególne etapy analizy, każdy na danych przygotowanych przez poprzednie etapy
+    plan = get_analysis_plan()
+    original_arr, image_arr = get_image(image_bytes, plan.image_size)
+    scale_pixel_range = plan.get_scale_pixel_range(image_arr)
+    palette_start = get_start_palette(scale_pixel_range, plan.temperature_range, plan.danger_temp)
+    cases = {
+        'get_image': lambda: get_image(image_bytes, plan.image_size, False),
+        'get_image rgb': lambda: get_image(image_bytes, plan.image_size, True),
+        'count_danger_pixels': lambda: count_danger_pixels(image_arr, palette_start, scale_pixel_range, plan.temperature_range, plan.work_areas, 2, plan = plan),
+        'paint_danger_area': lambda: paint_danger_area(original_arr, image_arr, palette_start, plan.work_areas, (255, 0, 0), plan.image_size, plan),
+        'main': lambda: find_danger_percentage(image_bytes, show_image = False, print_result = False)
+    }
+    try:
+        from oldParser import find_hottest_pixel
+        cases['find_hottest_pixel'] = lambda: find_hottest_pixel(BytesIO(image_bytes), False, 0, 150, 5, hotspot_count = 5)
+    except ImportError as error:
+        print('Skipping find_hottest_pixel: {}'.format(error), file = stderr)
+    return cases
+
+def get_import_times(importtime_output: str) -> dict[str, float]:
+    # Łączny czas (w ms) importów najwyższego poziomu z wyjścia "python -X importtime"
+    # (linie "import time: własny [us] | łączny [us] | moduł", zagnieżdżone importy wcięte)
+    imports = {}
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[1].strip().isdigit() or fields[2].startswith('  '):
+            continue
+        imports[fields[2].strip()] = int(fields[1]) / 1000
+    return imports
+
+def measure_communicator(image_bytes: bytes, repeats: int) -> dict | None:
+    # Całe wywołanie "python communicator.py --stdin", tak jak uruchamia je serwer - razem ze startem interpretera i importami.
+    # Czas to czas do pierwszego (jedynego) wyniku, a -X importtime pokazuje, ile z tego zajmują importy
+    script = join(dirname(abspath(__file__)), 'communicator.py')
+    latencies = []
+    for _ in range(repeats):
+        start = perf_counter()
+        result = run_process([executable, '-X', 'importtime', script, '--stdin'], input = image_bytes, stdout = DEVNULL, stderr = PIPE)
+        latencies.append(perf_counter() - start)
+        if result.returncode != 0:
+            print('Skipping communicator.main: exit code {} (is constants.py present?)'.format(result.returncode), file = stderr)
+            return None
+    summary = get_latency_summary(latencies, None)
+    imports = get_import_times(result.stderr.decode(errors = 'replace'))
+    summary['import ms'] = sum(imports.values())
+    summary['slowest imports'] = dict(sorted(imports.items(), key = lambda item: item[1], reverse = True)[:_slowest_imports_count])
+    return summary
+
+def check_startup(image_bytes: bytes, budget: float = _default_startup_budget) -> dict | None:
+    summary = measure_communicator(image_bytes, _subprocess_repeats)
+    if summary is not None:
+        summary['budget ms'] = 1000 * budget
+        summary['within budget'] = summary['p50 ms'] <= 1000 * budget
+    return summary
+
+def run_benchmarks(quick: bool = False) -> dict:
+    min_time, min_repeats = (_quick_min_time, _quick_min_repeats) if quick else (_default_min_time, _default_min_repeats)
+    results = {
+        'environment': {
+            'python': python_version.split()[0],
+            'numpy': numpy.__version__,
+            'pillow': PIL.__version__,
+            'platform': platform()
+        },
+        'cases': {}
+    }
+    frames = get_frames(quick)
+    for frame_name, image_bytes in frames.items():
+        for stage_name, function in get_stage_cases(image_bytes).items():
+            name = '{} / {}'.format(stage_name, frame_name)
+            print('Measuring {}'.format(name), file = stderr)
+            results['cases'][name] = measure(function, min_time, min_repeats)
+    frame_name = next(iter(frames))
+    print('Measuring communicator.main / {}'.format(frame_name), file = stderr)
+    communicator = measure_communicator(frames[frame_name], _quick_min_repeats if quick else _subprocess_repeats)
+    if communicator is not None:
+        results['cases']['communicator.main / {}'.format(frame_name)] = communicator
+    return results
+
+def compare_results(baseline: dict, current: dict, threshold: float = _default_threshold) -> list[dict]:
+    # Porównanie mediany czasu każdego przypadku. Stosunek powyżej threshold oznacza regresję
+    comparison = []
+    for name, case in current['cases'].items():
+        if name not in baseline['cases']:
+            continue
+        ratio = case['p50 ms'] / baseline['cases'][name]['p50 ms']
+        comparison.append({
+            'case': name,
+            'baseline p50 ms': baseline['cases'][name]['p50 ms'],
+            'p50 ms': case['p50 ms'],
+            'ratio': ratio,
+            'regression': ratio > threshold
+        })
+    return comparison
+
+def print_results(results: dict) -> None:
+    print('{:<48} {:>8} {:>10} {:>10} {:>10} {:>12}'.format('case', 'ops/s', 'p50 ms', 'p90 ms', 'p99 ms', 'peak KiB'), file = stderr)
+    for name, case in results['cases'].items():
+        peak = '-' if case['peak memory bytes'] is None else '{:.0f}'.format(case['peak memory bytes'] / 1024)
+        print('{:<48} {:>8.1f} {:>10.2f} {:>10.2f} {:>10.2f} {:>12}'.format(name, case['throughput'], case['p50 ms'], case['p90 ms'], case['p99 ms'], peak), file = stderr)
+
+def print_comparison(comparison: list[dict]) -> None:
+    print('{:<48} {:>12} {:>10} {:>8}'.format('case', 'baseline ms', 'p50 ms', 'ratio'), file = stderr)
+    for row in comparison:
+        print('{:<48} {:>12.2f} {:>10.2f} {:>8.2f}{}'.format(row['case'], row['baseline p50 ms'], row['p50 ms'], row['ratio'], '  REGRESSION' if row['regression'] else ''), file = stderr)
+
+def main() -> int:
+    # python parserBenchmark.py [wyniki.json]                    - pomiar, wyniki w JSON do pliku lub na standardowe wyjście
+    # python parserBenchmark.py --compare baza.json [wyniki.json] - pomiar i porównanie z zapisanymi wcześniej wynikami
+    # python parserBenchmark.py --startup                         - tylko czas uruchomienia communicator.py i sprawdzenie budżetu
+    args, errs, flags = utils.parse_argv(arg_flags, flags_shortened)
+    for err in errs:
+        print('Error:\n\tUnrecognized flag \"{}\"'.format(err), file = stderr)
+    if len(errs) > 0:
+        return 2
+    if flags['startup']:
+        frame_name, image_bytes = next(iter(get_frames(True).items()))
+        summary = check_startup(image_bytes)
+        if summary is None:
+            return 2
+        print('Time to first result: {:.1f} ms (budget {:.0f} ms), imports: {:.1f} ms'.format(summary['p50 ms'], summary['budget ms'], summary['import ms']), file = stderr)
+        for name, milliseconds in summary['slowest imports'].items():
+            print('    {:<32} {:>8.1f} ms'.format(name, milliseconds), file = stderr)
+        stdout.write(to_json(summary, indent = 4) + '\n')
+        return 0 if summary['within budget'] else 1
+    baseline = None
+    if flags['compare']:
+        if len(args) < 1:
+            print('Error:\n\tNo baseline file provided', file = stderr)
+            return 2
+        with open(args.pop(0), 'r') as file:
+            baseline = from_json(file.read())
+    results = run_benchmarks(flags['quick'])
+    print_results(results)
+    if baseline is not None:
+        results['comparison'] = compare_results(baseline, results)
+        print_comparison(results['comparison'])
+    if len(args) > 0:
+        with open(args[0], 'w') as file:
+            file.write(to_json(results, indent = 4))
+    else:
+        stdout.write(to_json(results, indent = 4) + '\n')
+    if baseline is not None and any(row['regression'] for row in results['comparison']):
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,147 @@
+import utils
+from communicator import analyze_frame, get_error_output
+from instrumentation import StageMetrics
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
+from socketserver import ThreadingTCPServer, StreamRequestHandler
+from json import dumps as to_json, loads as from_json
+from os import remove, cpu_count
+from os.path import exists
+from socket import socket, AF_INET, SOCK_STREAM
+
+# Protokół: klient wysyła ramkę z nagłówkiem JSON (np. {"profile": {"danger temp": 60}}, może być pusta)
+# i ramkę z bajtami obrazu, a daemon odpowiada ramką z wynikiem w JSON. Jedno połączenie może wysłać wiele obrazów.
+# Nagłówek {"camera": "id"} wybiera profil kamery z pliku profili, a "profile" podany obok zmienia tylko wybrane klucze
+
+class FrameHandler(StreamRequestHandler):
+    def handle(self) -> None:
+        while True:
+            try:
+                header = utils.read_frame(self.rfile, self.server.max_frame_bytes)
+                if header is None:
+                    return
+                image_bytes = utils.read_frame(self.rfile, self.server.max_frame_bytes)
+                if image_bytes is None:
+                    return
+            except utils.FrameTooLargeError as error:
+                # Dane zbyt dużej ramki nie są czytane, więc po odpowiedzi połączenie jest zamykane
+                output = {'error msg': 'Invalid request header: {}'.format(error)}
+                self.server.observe(output)
+                try:
+                    utils.write_frame(self.wfile, to_json(output).encode())
+                except ConnectionError:
+                    pass
+                return
+            except (EOFError, ConnectionError):
+                return
+            request = {}
+            try:
+                request = from_json(header) if header else {}
+                profile = self.server.get_profile(request)
+            except ValueError as error:
+                output = {'error msg': 'Invalid request header: {}'.format(error)}
+            except KeyError as error:
+                output = {'error msg': 'Unknown camera \"{}\"'.format(error.args[0])}
+            else:
+                try:
+                    output = self.server.analyze(image_bytes, profile)
+                except Exception as error:
+                    # Błąd puli procesów (np. BrokenProcessPool po zabiciu procesu) też dostaje odpowiedź, a połączenie zostaje otwarte
+                    output = get_error_output(error)
+            if isinstance(request, dict) and 'camera' in request:
+                output['camera'] = request['camera']
+            self.server.observe(output)
+            try:
+                utils.write_frame(self.wfile, to_json(output).encode())
+            except ConnectionError:
+                return
+
+class DaemonServer(ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, pool: ProcessPoolExecutor, address_family: int = AF_INET, metrics_file: str | None = None, metrics_interval: float = 10., camera_profiles: dict[str, dict] | None = None, workers: int | None = None, max_frame_bytes: int | None = None):
+        self.address_family = address_family
+        self.pool = pool
+        self.workers = workers or cpu_count()
+        self.pool_lock = Lock()
+        self.camera_profiles = camera_profiles or {}
+        self.max_frame_bytes = max_frame_bytes
+        # Czasy etapów wszystkich analiz zbierane są tutaj, bo procesy z puli nie dzielą pamięci
+        self.metrics = StageMetrics() if metrics_file is not None else None
+        self.metrics_file = metrics_file
+        self.metrics_interval = metrics_interval
+        super().__init__(address, FrameHandler)
+
+    def analyze(self, image_bytes: bytes, profile: dict | None) -> dict:
+        pool = self.pool
+        try:
+            return pool.submit(analyze_frame, image_bytes, profile).result()
+        except BrokenProcessPool:
+            # Nagle zakończony proces psuje całą pulę, więc kolejne obrazy trafiają już do nowej
+            with self.pool_lock:
+                if self.pool is pool:
+                    self.pool = ProcessPoolExecutor(max_workers = self.workers)
+            raise
+
+    def get_profile(self, request: dict) -> dict | None:
+        # Nagłówek musi być obiektem JSON, tak jak profil, a identyfikator kamery napisem
+        if not isinstance(request, dict):
+            raise ValueError('header must be a JSON object')
+        if request.get('profile') is not None and not isinstance(request['profile'], dict):
+            raise ValueError('\"profile\" must be a JSON object')
+        if 'camera' in request and not isinstance(request['camera'], str):
+            raise ValueError('\"camera\" must be a string')
+        if 'camera' not in request:
+            return request.get('profile')
+        profile = dict(self.camera_profiles[request['camera']])
+        profile.update(request.get('profile') or {})
+        return profile
+
+    def observe(self, output: dict) -> None:
+        if self.metrics is None:
+            return
+        self.metrics.observe(output)
+        self.metrics.write_if_due(self.metrics_file, self.metrics_interval)
+
+def run_daemon(address: tuple[str, int], socket_path: str | None = None, workers: int | None = None, metrics_file: str | None = None, metrics_interval: float = 10., camera_profiles: dict[str, dict] | None = None, max_frame_bytes: int | None = None) -> None:
+    workers = workers or cpu_count()
+    with ProcessPoolExecutor(max_workers = workers) as pool:
+        if socket_path is not None:
+            # Gniazda Unix nie są dostępne na każdej platformie, dlatego import dopiero tutaj
+            from socket import AF_UNIX
+            if exists(socket_path):
+                remove(socket_path)
+            server = DaemonServer(socket_path, pool, AF_UNIX, metrics_file, metrics_interval, camera_profiles, workers, max_frame_bytes)
+        else:
+            server = DaemonServer(tuple(address), pool, metrics_file = metrics_file, metrics_interval = metrics_interval, camera_profiles = camera_profiles, workers = workers, max_frame_bytes = max_frame_bytes)
+        with server:
+            print('Parser daemon listening on {} with {} workers'.format(socket_path or '{}:{}'.format(*address), workers))
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            if server.metrics is not None:
+                server.metrics.write(metrics_file)
+            if server.pool is not pool:
+                server.pool.shutdown()
+        if socket_path is not None and exists(socket_path):
+            remove(socket_path)
+
+def request_analysis(image_bytes: bytes, profile: dict | None = None, address: tuple[str, int] | None = None, socket_path: str | None = None, camera: str | None = None) -> dict:
+    # Pomocnicza funkcja dla klientów w Pythonie, otwiera nowe połączenie dla jednego obrazu
+    if socket_path is not None:
+        from socket import AF_UNIX
+        connection = socket(AF_UNIX, SOCK_STREAM)
+        connection.connect(socket_path)
+    else:
+        connection = socket(AF_INET, SOCK_STREAM)
+        connection.connect(tuple(address))
+    with connection, connection.makefile('rwb') as stream:
+        header = {} if profile is None else {'profile': profile}
+        if camera is not None:
+            header['camera'] = camera
+        utils.write_frame(stream, to_json(header).encode())
+        utils.write_frame(stream, image_bytes)
+        return from_json(utils.read_frame(stream))
\ No newline at end of file
@@ -0,0 +1,289 @@
+from resultDelivery import create_session, post_results
+from json import dumps as to_json, loads as from_json
+from os import makedirs, listdir, remove, replace, fsync, getpid
+from os.path import join, getsize
+from threading import Thread, Condition, Event
+from time import monotonic
+
+_default_segment_bytes = 1024 * 1024
+_default_max_bytes = 64 * 1024 * 1024
+_default_fsync_interval = 0.2
+_default_batch_size = 64
+_default_timeout = 10.
+_default_retry_delay = 1.
+_default_max_retry_delay = 60.
+_segment_extension = '.jsonl'
+_cursor_filename = 'cursor.json'
+_lock_filename = 'outbox.lock'
+
+def lock_file(file, blocking: bool = True) -> bool:
+    # Blokada zwalniana przez system, gdy proces się zakończy, więc awaria nie zostawia zablokowanego folderu.
+    # Bez blocking zwraca False, jeśli blokadę trzyma inny proces
+    try:
+        from fcntl import flock, LOCK_EX, LOCK_NB
+    except ImportError:
+        from msvcrt import locking, LK_LOCK, LK_NBLCK
+        while True:
+            try:
+                locking(file.fileno(), LK_LOCK if blocking else LK_NBLCK, 1)
+                return True
+            except OSError:
+                if not blocking:
+                    return False
+    try:
+        flock(file.fileno(), LOCK_EX if blocking else LOCK_EX | LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+def get_segment_filename(number: int) -> str:
+    return '{:010d}{}'.format(number, _segment_extension)
+
+class ResultOutbox:
+    # Trwała skrzynka nadawcza: każdy wynik najpierw dopisywany jest jako linia JSON do pliku segmentu na dysku
+    # (fsync najwyżej co fsync_interval sekund, nie przy każdym wyniku), a wątek w tle wysyła zapisane wyniki paczkami.
+    # Pozycja ostatniego wysłanego wyniku trzymana jest w cursor.json, a całkowicie wysłane segmenty są usuwane.
+    # Gdy serwer nie odpowiada, wyniki czekają na dysku, a próby wysłania są ponawiane coraz rzadziej (do max_retry_delay).
+    # Jeśli segmenty zajmują max_bytes, append() czeka najwyżej timeout sekund na miejsce, a potem odrzuca wynik.
+    # Bez background wyniki wysyłane są tylko przez drain(). Z folderu korzysta naraz jeden proces, pozostałe czekają na blokadę,
+    # a bez wait_for_lock konstruktor zamiast czekać zgłasza BlockingIOError
+    def __init__(
+            self,
+            directory: str,
+            endpoint_url: str | None = None,
+            api_key: str | None = None,
+            segment_bytes: int = _default_segment_bytes,
+            max_bytes: int = _default_max_bytes,
+            fsync_interval: float = _default_fsync_interval,
+            batch_size: int = _default_batch_size,
+            timeout: float = _default_timeout,
+            retry_delay: float = _default_retry_delay,
+            max_retry_delay: float = _default_max_retry_delay,
+            background: bool = True,
+            wait_for_lock: bool = True
+    ):
+        self.directory = directory
+        self.endpoint_url = endpoint_url
+        self.api_key = api_key
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync_interval = fsync_interval
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.condition = Condition()
+        self.stopping = Event()
+        self.counters = {
+            'written': 0,
+            'sent': 0,
+            'rejected': 0,
+            'failed attempts': 0
+        }
+        makedirs(directory, exist_ok = True)
+        self.lock = open(join(directory, _lock_filename), 'ab')
+        if not lock_file(self.lock, wait_for_lock):
+            self.lock.close()
+            raise BlockingIOError('Outbox {} is used by another process'.format(directory))
+        self.cursor = self.load_cursor()
+        self.segments = sorted(int(name[:-len(_segment_extension)]) for name in listdir(directory) if name.endswith(_segment_extension))
+        self.segments = [number for number in self.segments if number >= self.cursor['segment']]
+        if not self.segments:
+            self.segments = [self.cursor['segment']]
+        self.recover_last_segment()
+        self.file = open(self.get_segment_path(self.segments[-1]), 'ab')
+        self.total_bytes = sum(self.get_segment_size(number) for number in self.segments)
+        self.unsynced = False
+        self.last_sync = monotonic()
+        self.session = None
+        self.worker = None
+        if endpoint_url is not None:
+            self.session = create_session(1)
+        if endpoint_url is not None and background:
+            self.worker = Thread(target = self.run, name = 'ResultOutbox', daemon = True)
+            self.worker.start()
+
+    def get_segment_path(self, number: int) -> str:
+        return join(self.directory, get_segment_filename(number))
+
+    def get_segment_size(self, number: int) -> int:
+        try:
+            return getsize(self.get_segment_path(number))
+        except OSError:
+            return 0
+
+    def load_cursor(self) -> dict:
+        try:
+            with open(join(self.directory, _cursor_filename), 'r') as file:
+                cursor = from_json(file.read())
+            return {'segment': int(cursor['segment']), 'offset': int(cursor['offset'])}
+        except (OSError, ValueError, KeyError):
+            return {'segment': 0, 'offset': 0}
+
+    def save_cursor(self, cursor: dict) -> None:
+        path = join(self.directory, _cursor_filename)
+        temporary_path = '{}.{}.tmp'.format(path, getpid())
+        with open(temporary_path, 'w') as file:
+            file.write(to_json(cursor))
+            file.flush()
+            fsync(file.fileno())
+        replace(temporary_path, path)
+
+    def recover_last_segment(self) -> None:
+        # Po awarii ostatnia linia mogła zostać zapisana tylko częściowo - jest obcinana, bo nigdy nie została potwierdzona
+        path = self.get_segment_path(self.segments[-1])
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+        except OSError:
+            return
+        if data and not data.endswith(b'\n'):
+            with open(path, 'r+b') as file:
+                file.truncate(data.rfind(b'\n') + 1)
+
+    def append(self, output: dict, timeout: float = 0.) -> bool:
+        line = (to_json(output) + '\n').encode()
+        with self.condition:
+            if self.total_bytes + len(line) > self.max_bytes:
+                self.condition.wait_for(lambda: self.total_bytes + len(line) <= self.max_bytes, timeout)
+                if self.total_bytes + len(line) > self.max_bytes:
+                    self.counters['rejected'] += 1
+                    return False
+            if self.file.tell() > 0 and self.file.tell() + len(line) > self.segment_bytes:
+                self.rotate()
+            self.file.write(line)
+            self.file.flush()
+            self.total_bytes += len(line)
+            self.counters['written'] += 1
+            self.unsynced = True
+            if monotonic() - self.last_sync >= self.fsync_interval:
+                self.sync()
+            self.condition.notify_all()
+        return True
+
+    def sync(self) -> None:
+        # Wywoływane z zablokowanym self.condition
+        if self.unsynced:
+            fsync(self.file.fileno())
+            self.unsynced = False
+        self.last_sync = monotonic()
+
+    def rotate(self) -> None:
+        self.sync()
+        self.file.close()
+        self.segments.append(self.segments[-1] + 1)
+        self.file = open(self.get_segment_path(self.segments[-1]), 'ab')
+
+    def read_batch(self) -> tuple[list[dict], dict]:
+        # Kolejne niewysłane wyniki (tylko pełne linie) i pozycja za nimi
+        records = []
+        cursor = self.cursor.copy()
+        with self.condition:
+            segments = list(self.segments)
+        for number in segments:
+            if number < cursor['segment']:
+                continue
+            if number > cursor['segment']:
+                cursor = {'segment': number, 'offset': 0}
+            with open(self.get_segment_path(number), 'rb') as file:
+                file.seek(cursor['offset'])
+                while len(records) < self.batch_size:
+                    line = file.readline()
+                    if not line.endswith(b'\n'):
+                        break
+                    cursor['offset'] += len(line)
+                    try:
+                        records.append(from_json(line))
+                    except ValueError:
+                        continue
+            if len(records) >= self.batch_size:
+                break
+        return records, cursor
+
+    def acknowledge(self, cursor: dict) -> None:
+        self.save_cursor(cursor)
+        with self.condition:
+            self.cursor = cursor
+            # Kompakcja: segmenty przed kursorem są już w całości wysłane
+            while len(self.segments) > 1 and self.segments[0] < cursor['segment']:
+                number = self.segments.pop(0)
+                self.total_bytes -= self.get_segment_size(number)
+                remove(self.get_segment_path(number))
+            # Całkowicie wysłany bieżący segment zaczynany jest od nowa
+            if cursor['segment'] == self.segments[-1] and cursor['offset'] == self.file.tell() and cursor['offset'] >= self.segment_bytes:
+                self.rotate()
+            self.condition.notify_all()
+
+    def drain_once(self) -> int:
+        # Wysyła jedną paczkę. Zwraca liczbę wysłanych wyników lub -1, jeśli się nie udało
+        records, cursor = self.read_batch()
+        if not records:
+            if cursor != self.cursor:
+                self.acknowledge(cursor)
+            return 0
+        if not post_results(self.session, self.endpoint_url, self.api_key, records, self.timeout, 0):
+            with self.condition:
+                self.counters['failed attempts'] += 1
+            return -1
+        self.acknowledge(cursor)
+        with self.condition:
+            self.counters['sent'] += len(records)
+        return len(records)
+
+    def has_pending(self) -> bool:
+        with self.condition:
+            return self.cursor['segment'] != self.segments[-1] or self.cursor['offset'] < self.file.tell()
+
+    def drain(self, max_batches: int | None = None) -> int:
+        # Wysyła wszystko co czeka (albo najwyżej max_batches paczek), aż do pierwszego niepowodzenia. Zwraca liczbę wysłanych wyników
+        total = 0
+        if self.session is None:
+            return total
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            sent = self.drain_once()
+            if sent <= 0:
+                return total
+            total += sent
+            batches += 1
+        return total
+
+    def run(self) -> None:
+        delay = self.retry_delay
+        while not self.stopping.is_set():
+            with self.condition:
+                if monotonic() - self.last_sync >= self.fsync_interval:
+                    self.sync()
+                if not (self.cursor['segment'] != self.segments[-1] or self.cursor['offset'] < self.file.tell()):
+                    self.condition.wait(self.fsync_interval)
+                    continue
+            sent = self.drain_once()
+            if sent < 0:
+                self.stopping.wait(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+            else:
+                delay = self.retry_delay
+
+    def get_counters(self) -> dict:
+        with self.condition:
+            counters = self.counters.copy()
+            counters['pending bytes'] = self.total_bytes
+        return counters
+
+    def close(self, timeout: float = 0.) -> None:
+        # Próbuje wysłać resztę najwyżej przez timeout sekund - co się nie uda, zostaje na dysku na następny raz
+        if self.worker is not None:
+            deadline = monotonic() + timeout
+            while self.has_pending() and monotonic() < deadline:
+                with self.condition:
+                    self.condition.wait(0.05)
+            self.stopping.set()
+            with self.condition:
+                self.condition.notify_all()
+            self.worker.join()
+        if self.session is not None:
+            self.session.close()
+        with self.condition:
+            self.sync()
+            self.file.close()
+        self.lock.close()
@@ -0,0 +1,71 @@
+from numpy import arange, float64, ndarray, save as save_array, exp, log, sqrt, errstate
+from functools import lru_cache
+
+# Tablice przeliczające wartość piksela na temperaturę, liczone raz dla danej kalibracji.
+# Tablice float64 dają dokładnie te same wartości co wzory liczone dla pojedynczych pikseli,
+# a mapy temperatur tworzone są z tablic float32
+_palette_levels = 256
+_radiometric_levels = 65536
+
+@lru_cache(maxsize = 128)
+def get_palette_lut(scale_pixel_range: tuple[int, int], temperature_range: tuple[float, float], dtype: type = float64) -> ndarray:
+    # Odcień szarości (0-255) na temperaturę według kalibracji z paska palety. Pasek o jednakowych końcach (zasłonięty
+    # lub czarny obraz) nie pozwala przeliczyć temperatur, więc jest to błąd obrazu, a nie wynik z NaN
+    if scale_pixel_range[0] == scale_pixel_range[1]:
+        raise ValueError('Palette scale is flat (both ends have gray value {}), temperatures cannot be calibrated'.format(scale_pixel_range[0]))
+    if dtype is not float64:
+        lut = get_palette_lut(scale_pixel_range, temperature_range).astype(dtype)
+    else:
+        values = arange(_palette_levels, dtype = float64)
+        lut = (temperature_range[1] - temperature_range[0]) * (values - scale_pixel_range[0]) / (scale_pixel_range[1] - scale_pixel_range[0]) + temperature_range[0]
+    lut.flags.writeable = False
+    return lut
+
+@lru_cache(maxsize = 2)
+def get_radiometric_lut(dtype: type = float64) -> ndarray:
+    # Surowa wartość 16-bitowa (setne części kelwina) na temperaturę, tak jak oldParser.get_temperature_from_value
+    if dtype is not float64:
+        lut = get_radiometric_lut().astype(dtype)
+    else:
+        lut = arange(_radiometric_levels, dtype = float64) / 100 - 273.15
+    lut.flags.writeable = False
+    return lut
+
+@lru_cache(maxsize = 16)
+def get_planck_lut(calibration: tuple[tuple[str, float], ...], dtype: type = float64) -> ndarray:
+    # Surowa wartość z czujnika FLIR (0-65535) na temperaturę obiektu w stopniach Celsjusza, ze wzoru Plancka
+    # z poprawkami na emisyjność, odbicie, tłumienie przez atmosferę i okno IR (tak jak w ExifTool i flirimageextractor).
+    # Kalibracja to krotka par (nazwa, wartość) z flirRadiometric.get_calibration. Wartości poza zakresem wzoru dają nan
+    if dtype is not float64:
+        lut = get_planck_lut(calibration).astype(dtype)
+        lut.flags.writeable = False
+        return lut
+    c = dict(calibration)
+    r1, r2, b, f, o = c['planck r1'], c['planck r2'], c['planck b'], c['planck f'], c['planck o']
+    emissivity = c['emissivity']
+    window_transmission = c['ir window transmission']
+    atmospheric_temperature = c['atmospheric temperature'] - 273.15
+    # Zawartość pary wodnej i przepuszczalność atmosfery na połowie odległości do obiektu
+    water = c['relative humidity'] * exp(1.5587 + 0.06939 * atmospheric_temperature - 0.00027816 * atmospheric_temperature**2 + 0.00000068455 * atmospheric_temperature**3)
+    half_distance = sqrt(c['object distance'] / 2)
+    tau = c['atmospheric x'] * exp(-half_distance * (c['atmospheric alpha 1'] + c['atmospheric beta 1'] * sqrt(water))) \
+        + (1 - c['atmospheric x']) * exp(-half_distance * (c['atmospheric alpha 2'] + c['atmospheric beta 2'] * sqrt(water)))
+    get_raw = lambda kelvin: r1 / (r2 * (exp(b / kelvin) - f)) - o
+    raw_reflected = (1 - emissivity) / emissivity * get_raw(c['reflected temperature'])
+    raw_atmosphere_1 = (1 - tau) / emissivity / tau * get_raw(c['atmospheric temperature'])
+    raw_window = (1 - window_transmission) / emissivity / tau / window_transmission * get_raw(c['ir window temperature'])
+    raw_atmosphere_2 = (1 - tau) / emissivity / tau / window_transmission / tau * get_raw(c['atmospheric temperature'])
+    # Promieniowanie obiektu zależy liniowo od surowej wartości, więc wystarczy policzyć je dla wszystkich 65536 wartości naraz
+    values = arange(_radiometric_levels, dtype = float64)
+    raw_object = values / emissivity / tau / window_transmission / tau - raw_atmosphere_1 - raw_atmosphere_2 - raw_window - raw_reflected
+    with errstate(divide = 'ignore', invalid = 'ignore'):
+        lut = b / log(r1 / (r2 * (raw_object + o)) + f) - 273.15
+    lut.flags.writeable = False
+    return lut
+
+def get_temperature_map(image_arr: ndarray, lut: ndarray) -> ndarray:
+    # Wektorowe przeliczenie całego obrazu (uint8 lub uint16) przez tablicę, np. get_palette_lut(..., float32)
+    return lut[image_arr]
+
+def save_temperature_map(temperature_map: ndarray, filename: str) -> None:
+    save_array(filename, temperature_map)
\ No newline at end of file
@@ -1,4 +1,7 @@
 from sys import argv
+from struct import pack, unpack
+
+_frame_header_size = 4
 
 def parse_argv(arg_flags: list = [], flags_shortened: dict = {}) -> tuple[list[str], list[str], dict]:
     params = []
@@ -19,4 +22,39 @@ def parse_argv(arg_flags: list = [], flags_shortened: dict = {}) -> tuple[list[s
                 flags_not_found.append(argv[i])
         else:
             params.append(argv[i])
-    return (params, flags_not_found, flags)
\ No newline at end of file
+    return (params, flags_not_found, flags)
+
+def read_exactly(stream, size: int) -> bytes | None:
+    # Zwraca None, jeśli strumień skończył się przed pierwszym bajtem
+    data = b''
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            if len(data) == 0:
+                return None
+            raise EOFError('Stream ended after {} of {} bytes'.format(len(data), size))
+        data += chunk
+    return data
+
+class FrameTooLargeError(ValueError):
+    # Dane za nagłówkiem nie są czytane, więc strumień nie nadaje się już do czytania kolejnych ramek
+    pass
+
+def read_frame(stream, max_size: int | None = None) -> bytes | None:
+    # Ramka to 4-bajtowa długość (big endian) i dane. Długość większa niż max_size jest odrzucana przed czytaniem danych
+    header = read_exactly(stream, _frame_header_size)
+    if header is None:
+        return None
+    length = unpack('>I', header)[0]
+    if max_size is not None and length > max_size:
+        raise FrameTooLargeError('Frame of {} bytes exceeds the limit of {} bytes'.format(length, max_size))
+    if length == 0:
+        return b''
+    data = read_exactly(stream, length)
+    if data is None:
+        raise EOFError('Stream ended before frame data')
+    return data
+
+def write_frame(stream, data: bytes) -> None:
+    stream.write(pack('>I', len(data)) + data)
+    stream.flush()
\ No newline at end of file